@@ -0,0 +1,97 @@
+# adaptive concurrency benchmark for the FullContact functions; runs batches
+# of enrich-people lookups against the local stub server set up to handle
+# only a given number of requests at a time (beyond which requests queue and
+# then get 429s), with a fixed concurrency that's too low, about right and
+# too high, and then with the adaptive concurrency limit, and reports the
+# throughput, the 429s and failed calls, and for the adaptive limit, where
+# it settled and the reasons it changed
+#
+# usage: python benchmarks/adaptive.py [--rows N] [--capacity N] [--latency MS] [--max-concurrency N]
+
+import os
+import time
+import argparse
+import threading
+
+# don't let the client-side rate limiter get in the way; the stub's
+# capacity is what limits the lookups here
+os.environ.setdefault('FULLCONTACT_RATE_LIMIT', '1000000')
+os.environ.setdefault('FULLCONTACT_RATE_LIMIT_BURST', '1000000')
+
+from harness import Flex, load_function, reset_state
+from stub_server import StubServer
+
+def run_batches(module, rows, batch_size, concurrency, prefix):
+    vars = {'fullcontact_api_key': 'benchmark', 'fullcontact_time_budget': 0}
+    if concurrency is not None:
+        vars['fullcontact_concurrency'] = concurrency
+    errors = 0
+    start = time.perf_counter()
+    for i in range(0, rows, batch_size):
+        emails = [['%s%d@example.com' % (prefix, n)] for n in range(i, min(i + batch_size, rows))]
+        try:
+            module.flexio_handler(Flex([emails], vars))
+        except Exception:
+            errors += 1
+    return time.perf_counter() - start, errors
+
+def sample_limit(limiter, samples, stop):
+    # record the limit every few milliseconds while the batches run
+    while not stop.wait(0.01):
+        samples.append(limiter.snapshot()['limit'])
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure how the adaptive concurrency limit converges against a stub server with limited capacity')
+    parser.add_argument('--rows', type=int, default=1500, help='number of rows to look up for each setting')
+    parser.add_argument('--batch-size', type=int, default=500, help='number of rows in each call')
+    parser.add_argument('--capacity', type=int, default=16, help='the number of requests the stub server can handle at a time')
+    parser.add_argument('--latency', type=float, default=100, help='the stub server latency in milliseconds')
+    parser.add_argument('--max-concurrency', type=int, default=64, help='the maximum for the adaptive limit')
+    args = parser.parse_args()
+
+    stub = StubServer(latency=args.latency/1000.0, capacity=args.capacity).start()
+    import fullcontact_core
+    fullcontact_core.API_URL = stub.url
+    module = load_function('fullcontact-enrich-people')
+
+    settings = [('fixed', max(args.capacity // 4, 1)), ('fixed', args.capacity), ('fixed', args.max_concurrency), ('adaptive', None)]
+    print('stub capacity: %d requests at a time, latency: %.0f ms' % (args.capacity, args.latency))
+    print()
+    print('%-10s %12s %10s %10s %10s %14s' % ('setting', 'concurrency', 'rows/sec', '429s', 'errors', 'settled limit'))
+    try:
+        for index, (setting, concurrency) in enumerate(settings):
+            reset_state()
+            fullcontact_core.disable_adaptive_concurrency()
+            samples = []
+            stop = threading.Event()
+            sampler = None
+            if setting == 'adaptive':
+                limiter = fullcontact_core.enable_adaptive_concurrency(args.max_concurrency)
+                sampler = threading.Thread(target=sample_limit, args=(limiter, samples, stop), daemon=True)
+                sampler.start()
+
+            stub.counts = {}
+            # each setting looks up different emails so none come from the cache
+            elapsed, errors = run_batches(module, args.rows, args.batch_size, concurrency, 'run%d-person' % index)
+            stop.set()
+            if sampler is not None:
+                sampler.join()
+
+            # the limit it settled on is the average over the second half
+            # of the run, after it's had time to converge
+            settled = samples[len(samples)//2:]
+            print('%-10s %12s %10.1f %10d %10d %14s' % (
+                setting, concurrency if concurrency is not None else '1-%d' % args.max_concurrency, args.rows / elapsed,
+                stub.counts.get(429, 0), errors, '%.1f' % (sum(settled) / float(len(settled))) if len(settled) > 0 else '-'))
+            if setting == 'adaptive':
+                snapshot = limiter.snapshot()
+                print()
+                print('limit over time: ' + ' '.join(str(limit) for limit in samples[::max(len(samples)//20, 1)]))
+                print('changes: ' + ', '.join('%s=%d' % item for item in sorted(snapshot['changes'].items())))
+                print('latency: %.1f ms (lowest %.1f ms)' % (snapshot['latency_seconds']*1000, snapshot['baseline_seconds']*1000))
+    finally:
+        stub.stop()
+        fullcontact_core.disable_adaptive_concurrency()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+# columnar output benchmark for the bulk runner; builds a set of enriched
+# rows like the ones enrich-people-org writes (a distinct email and name for
+# each row, with organizations, locations, titles, genders and age ranges
+# repeated across the rows) and reports the memory they take as rows of
+# values and as a table of dictionary-encoded columns, and the size of the
+# output as JSONL, JSON columns and (if pyarrow is installed) Parquet
+#
+# usage: python benchmarks/columns.py [--rows N]
+
+import os
+import sys
+import random
+import argparse
+import tempfile
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fullcontact_bulk import Table, dumps, get_pyarrow
+
+GIVEN = ['Bilbo', 'Frodo', 'Samwise', 'Meriadoc', 'Peregrin', 'Rosie', 'Lobelia', 'Otho', 'Hamfast', 'Daisy']
+FAMILY = ['Baggins', 'Gamgee', 'Brandybuck', 'Took', 'Cotton', 'Sackville', 'Proudfoot', 'Boffin', 'Bolger', 'Burrows']
+
+def create_record(i, rng):
+    # the values come from small sets as they do in real results; each one
+    # is a new string, as it would be when it's decoded from a response
+    organization = rng.randrange(500)
+    return {
+        'email': 'person%d@example%d.com' % (i, organization),
+        'full_name': '%s %s' % (rng.choice(GIVEN), rng.choice(FAMILY)),
+        'age_range': '%d-%d' % (rng.randrange(2, 8) * 10, rng.randrange(2, 8) * 10 + 9),
+        'gender': rng.choice(['Male', 'Female', '']),
+        'location': 'City %d, Country %d' % (organization % 100, organization % 20),
+        'title': 'Title %d' % rng.randrange(200),
+        'organization': 'Organization %d' % organization,
+        'org_name': 'Organization %d' % organization,
+        'org_location': 'City %d, Country %d' % (organization % 100, organization % 20),
+        'org_employees': str(10 * (organization + 1)),
+        'org_category': 'Category %d' % (organization % 25),
+        'org_website': 'https://example%d.com' % organization
+    }
+
+def measure(create):
+    tracemalloc.start()
+    result = create()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the memory and output size of the columnar output format')
+    parser.add_argument('--rows', type=int, default=200000, help='number of rows to build')
+    args = parser.parse_args()
+
+    def create_rows():
+        rng = random.Random(1)
+        return [create_record(i, rng) for i in range(args.rows)]
+
+    def create_table():
+        rng = random.Random(1)
+        table = Table()
+        for i in range(args.rows):
+            table.append(create_record(i, rng))
+        return table
+
+    rows, rows_memory = measure(create_rows)
+    table, table_memory = measure(create_table)
+    print('%-24s %14s' % ('in memory', 'MiB'))
+    print('%-24s %14.1f' % ('rows', rows_memory / 1048576.0))
+    print('%-24s %14.1f' % ('columns', table_memory / 1048576.0))
+    print()
+    print('dictionary-encoded columns: ' + ', '.join(name for name, column in table.columns.items() if column.values is None))
+    print()
+
+    print('%-24s %14s' % ('output', 'MiB'))
+    with tempfile.TemporaryDirectory() as path:
+        jsonl_path = os.path.join(path, 'output.jsonl')
+        with open(jsonl_path, 'w', encoding='utf-8') as f:
+            for record in rows:
+                f.write(dumps(record) + '\n')
+        print('%-24s %14.1f' % ('jsonl', os.path.getsize(jsonl_path) / 1048576.0))
+
+        formats = ['columns']
+        try:
+            get_pyarrow()
+            formats.append('parquet')
+        except ValueError:
+            pass
+        for format in formats:
+            output_path = os.path.join(path, 'output.' + format)
+            table.write(output_path, format)
+            print('%-24s %14.1f' % (format, os.path.getsize(output_path) / 1048576.0))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+# shared helpers for the benchmarks; a stand-in for the flex object that
+# Flex.io passes to each function and a way to load the function files,
+# whose names aren't valid module names
+
+import os
+import sys
+import json
+import importlib.util
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+class Stream:
+    def __init__(self, data=''):
+        self.data = data
+        self.content_type = None
+        self.written = []
+    def read(self):
+        return self.data
+    def write(self, data):
+        self.written.append(data)
+
+class Flex:
+    def __init__(self, input, vars=None):
+        self.vars = vars or {'fullcontact_api_key': 'benchmark'}
+        self.input = Stream(json.dumps(input))
+        self.output = Stream()
+
+def load_function(name):
+    spec = importlib.util.spec_from_file_location(name.replace('-', '_'), os.path.join(ROOT, name + '.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def reset_state():
+    # drop the shared cache, rate limiter and other per-process state so each
+    # benchmark starts cold
+    import fullcontact_core
+    for name in ('_cache', '_rate_limiter', '_single_flight', '_poller', '_identities', '_circuit_breaker'):
+        setattr(fullcontact_core, name, None)
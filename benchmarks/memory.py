@@ -0,0 +1,97 @@
+# response parsing benchmark for the FullContact functions; measures the
+# time to decode a person.enrich response and the memory each response
+# keeps in the cache, for:
+#
+#   decoded:   the whole response decoded with json (as the functions did
+#              before) and the decoded content cached
+#   text:      the json text of the response cached and decoded when it's
+#              used, keeping only the fields for the requested properties
+#
+# and then the memory used by a batch of enrich-people lookups against the
+# local stub server
+#
+# usage: python benchmarks/memory.py [--rows N] [--properties "full_name"]
+
+import os
+import json
+import time
+import argparse
+import tracemalloc
+
+os.environ.setdefault('FULLCONTACT_RATE_LIMIT', '1000000')
+os.environ.setdefault('FULLCONTACT_RATE_LIMIT_BURST', '1000000')
+
+from harness import Flex, load_function, reset_state
+from stub_server import StubServer, PERSON
+
+def time_per_call(fn, count):
+    start = time.perf_counter()
+    for i in range(count):
+        fn()
+    return (time.perf_counter() - start) / count
+
+def retained_per_item(create, count):
+    # return the memory kept by each of the items the function creates
+    tracemalloc.start()
+    items = [create(i) for i in range(count)]
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del items
+    return current / float(count)
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the time and memory used to parse FullContact responses')
+    parser.add_argument('--rows', type=int, default=2000, help='number of responses to parse and cache')
+    parser.add_argument('--properties', default='full_name', help='the properties to return')
+    args = parser.parse_args()
+
+    import fullcontact_core
+    from fullcontact_core import PERSON_PROPERTY_MAP, get_orjson, get_properties, get_projection, parse_content, to_list
+
+    properties = get_properties(to_list(args.properties), PERSON_PROPERTY_MAP)
+    projection = get_projection(properties, PERSON_PROPERTY_MAP)
+    body = json.dumps(PERSON)
+    print('response size: %d bytes, properties: %s, orjson: %s' % (len(body), ', '.join(properties), 'yes' if get_orjson() else 'no'))
+    print()
+
+    # decode time for each response
+    print('%-32s %14s' % ('decode', 'per row (us)'))
+    for name, fn in [
+        ('json (whole response)', lambda: projection(json.loads(body))),
+        ('parse_content (whole response)', lambda: projection(parse_content(body))),
+        ('parse_content (selected fields)', lambda: projection(parse_content(body, projection.keys)))
+    ]:
+        print('%-32s %14.2f' % (name, time_per_call(fn, args.rows) * 1000000))
+    print()
+
+    # memory kept by each cached response; each response is a distinct
+    # string, as it would be when it's read from the network
+    print('%-32s %14s' % ('cached response', 'per row (KiB)'))
+    for name, create in [
+        ('decoded content', lambda i: json.loads(body.replace('Bilbo', 'B%06d' % i))),
+        ('json text', lambda i: body.replace('Bilbo', 'B%06d' % i))
+    ]:
+        print('%-32s %14.2f' % (name, retained_per_item(create, args.rows) / 1024.0))
+    print()
+
+    # memory used by a batch of lookups, including the cache
+    stub = StubServer().start()
+    fullcontact_core.API_URL = stub.url
+    try:
+        module = load_function('fullcontact-enrich-people')
+        reset_state()
+
+        # make a call first so the imports and the session aren't counted
+        module.flexio_handler(Flex(['warmup@example.com', args.properties]))
+        input = [[['person%d@example.com' % i] for i in range(args.rows)], args.properties]
+        tracemalloc.start()
+        module.flexio_handler(Flex(input))
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        stub.stop()
+    print('%-32s %14s %14s' % ('batch', 'peak (KiB)', 'kept (KiB)'))
+    print('%-32s %14.1f %14.1f' % ('enrich-people (%d rows)' % args.rows, peak / 1024.0, current / 1024.0))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+# outage benchmark for the FullContact functions; looks up a batch of emails
+# with enrich-people against the local stub server while it's healthy, then
+# takes the stub down (every request gets a 503) and looks up the same
+# emails (whose cached results have expired) and a batch of new ones, then
+# brings the stub back up; this is run with the circuit breaker on and off,
+# and for each step it reports how long the call took, what it returned
+# and the number of requests the stub got
+#
+# usage: python benchmarks/outage.py [--rows N] [--latency MS]
+
+import os
+import time
+import argparse
+
+# keep the results for only a second so they're stale during the outage,
+# and use a short reset time so the recovery doesn't take long
+os.environ.setdefault('FULLCONTACT_RATE_LIMIT', '1000000')
+os.environ.setdefault('FULLCONTACT_RATE_LIMIT_BURST', '1000000')
+os.environ.setdefault('FULLCONTACT_PERSON_CACHE_TTL', '1')
+os.environ.setdefault('FULLCONTACT_CIRCUIT_RESET_TIMEOUT', '1')
+
+from harness import Flex, load_function, reset_state
+from stub_server import StubServer
+
+def run_call(module, stub, emails):
+    stub.counts = {}
+    flex = Flex([[[email] for email in emails]], {'fullcontact_api_key': 'benchmark', 'fullcontact_time_budget': 0})
+    start = time.perf_counter()
+    try:
+        module.flexio_handler(flex)
+        output = ''.join(flex.output.written)
+        result = '%d rows, %d blank' % (len(emails), output.count('[""]'))
+    except Exception as e:
+        result = 'error: %s' % e
+    return time.perf_counter() - start, result, sum(stub.counts.values())
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the functions during an outage of the API, with and without the circuit breaker')
+    parser.add_argument('--rows', type=int, default=40, help='number of rows in each call')
+    parser.add_argument('--latency', type=float, default=20, help='the stub server latency in milliseconds')
+    args = parser.parse_args()
+
+    stub = StubServer(latency=args.latency/1000.0).start()
+    import fullcontact_core
+    fullcontact_core.API_URL = stub.url
+    module = load_function('fullcontact-enrich-people')
+    failures = fullcontact_core.CIRCUIT_FAILURES
+
+    print('%-8s %-28s %10s %10s  %s' % ('breaker', 'step', 'seconds', 'requests', 'result'))
+    try:
+        for breaker in (False, True):
+            reset_state()
+            fullcontact_core.CIRCUIT_FAILURES = failures if breaker else 0
+            known = ['known%d-%s@example.com' % (i, breaker) for i in range(args.rows)]
+            new = ['new%d-%s@example.com' % (i, breaker) for i in range(args.rows)]
+
+            steps = [('healthy', {200: 100}, known)]
+            steps.append(('down, stale results', {503: 100}, known))
+            steps.append(('down, new lookups', {503: 100}, new))
+            steps.append(('down, new lookups again', {503: 100}, new))
+            steps.append(('back up', {200: 100}, new))
+            for index, (step, mix, emails) in enumerate(steps):
+                stub.set_mix(mix)
+                if step == 'back up' or index == 1:
+                    # let the results expire or the circuit's reset time pass
+                    time.sleep(1.5)
+                elapsed, result, requests = run_call(module, stub, emails)
+                print('%-8s %-28s %10.2f %10d  %s' % ('on' if breaker else 'off', step, elapsed, requests, result))
+    finally:
+        stub.stop()
+        fullcontact_core.CIRCUIT_FAILURES = failures
+
+if __name__ == '__main__':
+    main()
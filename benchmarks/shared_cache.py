@@ -0,0 +1,98 @@
+# shared cache stress test for the FullContact functions; runs a number of
+# worker processes that each look up the same emails (in a different order)
+# against the local stub server, with the cache either in memory only (each
+# process has its own) or in a sqlite database shared by the processes, and
+# reports the hit rate and lookup latency for each number of workers
+#
+# usage: python benchmarks/shared_cache.py [--workers 1,2,4,8] [--keys N] [--latency MS]
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import multiprocessing
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from stub_server import StubServer
+
+def percentile(values, p):
+    values = sorted(values)
+    if len(values) == 0:
+        return 0.0
+    index = min(int(round(p / 100.0 * (len(values) - 1))), len(values) - 1)
+    return values[index]
+
+def run_worker(url, cache_path, emails, seed, start):
+    # the settings are read when fullcontact_core is imported, so set them
+    # first; each worker is a fresh process, as in Flex.io
+    os.environ['FULLCONTACT_API_URL'] = url
+    os.environ['FULLCONTACT_RATE_LIMIT'] = '1000000'
+    os.environ['FULLCONTACT_RATE_LIMIT_BURST'] = '1000000'
+    if cache_path:
+        os.environ['FULLCONTACT_CACHE_PATH'] = cache_path
+    from fullcontact_core import PERSON_PROPERTY_MAP, enrich_person, get_cache, get_projection
+
+    projection = get_projection(['full_name'], PERSON_PROPERTY_MAP)
+    get_cache()
+    emails = list(emails)
+    random.Random(seed).shuffle(emails)
+
+    # start all the workers at the same time
+    start.wait()
+    latencies = []
+    for email in emails:
+        call_start = time.perf_counter()
+        enrich_person('benchmark', email, projection)
+        latencies.append(time.perf_counter() - call_start)
+    return latencies
+
+def run_workers(workers, keys, latency, shared):
+    stub = StubServer(latency=latency).start()
+    emails = ['person%d@example.com' % i for i in range(keys)]
+    try:
+        with tempfile.TemporaryDirectory() as path:
+            cache_path = os.path.join(path, 'cache.db') if shared else None
+            context = multiprocessing.get_context('spawn')
+            with context.Manager() as manager:
+                start = manager.Barrier(workers + 1)
+                with context.Pool(workers) as pool:
+                    results = [pool.apply_async(run_worker, (stub.url, cache_path, emails, seed, start)) for seed in range(workers)]
+                    start.wait()
+                    started = time.perf_counter()
+                    latencies = [latency for result in results for latency in result.get()]
+                    elapsed = time.perf_counter() - started
+    finally:
+        stub.stop()
+
+    requests = sum(stub.counts.values())
+    return {
+        'workers': workers,
+        'cache': 'shared' if shared else 'memory',
+        'lookups': len(latencies),
+        'requests': requests,
+        'hit_rate': 1 - requests / float(len(latencies)),
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'elapsed': elapsed
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Stress test the shared cache with concurrent worker processes')
+    parser.add_argument('--workers', default='1,2,4,8', help='the numbers of worker processes to run, e.g. "1,2,4,8"')
+    parser.add_argument('--keys', type=int, default=200, help='number of distinct emails each worker looks up')
+    parser.add_argument('--latency', type=float, default=20, help='the stub server latency in milliseconds')
+    args = parser.parse_args()
+
+    print('%-8s %-8s %10s %10s %10s %10s %10s %10s' % ('workers', 'cache', 'lookups', 'requests', 'hit rate', 'p50 ms', 'p95 ms', 'seconds'))
+    for workers in [int(value) for value in args.workers.split(',')]:
+        for shared in (False, True):
+            r = run_workers(workers, args.keys, args.latency/1000.0, shared)
+            print('%-8d %-8s %10d %10d %9.1f%% %10.2f %10.2f %10.2f' % (
+                r['workers'], r['cache'], r['lookups'], r['requests'], r['hit_rate']*100, r['p50_ms'], r['p95_ms'], r['elapsed']))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+# startup benchmark for the FullContact functions; measures the time it takes
+# to load each function file in a fresh python process (the cold start on a
+# worker) and the per-call time to read, validate and map a function's input
+# (the work done before any lookup is sent)
+#
+# usage: python benchmarks/startup.py [--runs N] [--calls N]
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+from harness import ROOT, Flex, load_function
+
+FUNCTIONS = [
+    ('fullcontact-enrich-people', ['bbaggins@shire.com', 'full_name, title, bio']),
+    ('fullcontact-enrich-org', ['apple.com', 'website, founded, employees']),
+    ('fullcontact-find-person', ['bbaggins@shire.com', 'bbaggins', 'full_name'])
+]
+
+LOAD_SCRIPT = '''
+import sys, time, importlib.util
+start = time.perf_counter()
+spec = importlib.util.spec_from_file_location('function', sys.argv[1])
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+print(time.perf_counter() - start)
+'''
+
+def time_load(name, runs):
+    # load the function in a fresh process each time so nothing is cached
+    times = []
+    for i in range(runs):
+        output = subprocess.check_output([sys.executable, '-c', LOAD_SCRIPT, os.path.join(ROOT, name + '.py')], cwd=ROOT)
+        times.append(float(output))
+    return times
+
+def time_calls(name, input, calls):
+    # time reading and validating the input along with getting the
+    # properties to return, which is what each call does before a lookup
+    import fullcontact_core
+    module = load_function(name)
+    property_map = fullcontact_core.COMPANY_PROPERTY_MAP if 'org' in name else fullcontact_core.PERSON_PROPERTY_MAP
+    flex = Flex(input)
+    start = time.perf_counter()
+    for i in range(calls):
+        flex.input.data = json.dumps(input)
+        values = module.validator.read(flex)
+        fullcontact_core.get_properties(values['properties'], property_map)
+    return (time.perf_counter() - start) / calls
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the startup and per-call setup time of the FullContact functions')
+    parser.add_argument('--runs', type=int, default=10, help='number of cold starts to time for each function')
+    parser.add_argument('--calls', type=int, default=2000, help='number of calls to time for each function')
+    args = parser.parse_args()
+
+    print('%-28s %14s %14s' % ('function', 'load (ms)', 'per call (us)'))
+    for name, input in FUNCTIONS:
+        load = statistics.median(time_load(name, args.runs))
+        call = time_calls(name, input, args.calls)
+        print('%-28s %14.2f %14.2f' % (name, load*1000, call*1000000))
+
+if __name__ == '__main__':
+    main()
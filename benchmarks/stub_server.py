@@ -0,0 +1,222 @@
+# local stand-in for the FullContact API used by the benchmarks; serves
+# /v3/person.enrich and /v3/company.enrich with a configurable mix of
+# responses and latency so the functions can be measured without using
+# real API credits
+#
+# the found (200), pending (202), not found (404) and invalid (422) results
+# are chosen from a hash of the request body so the same lookup always gets
+# the same result; rate limited (429) and server error (5xx) responses are
+# chosen at random for each request since they're transient
+#
+# with a capacity, the stub also acts like a server that can only handle
+# that many requests at a time: requests beyond the capacity queue for it
+# (so the latency rises), and once the queue is as long as the capacity,
+# further requests are rate limited (429)
+#
+# usage: python benchmarks/stub_server.py [--port N] [--latency MS] [--mix 200=90,404=8,429=2] [--capacity N]
+
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_MIX = {200: 100}
+
+PERSON = {
+    'fullName': 'Bilbo Baggins',
+    'ageRange': '111-120',
+    'gender': 'Male',
+    'location': 'Bag End, The Shire',
+    'title': 'Burglar',
+    'organization': 'Thorin and Company',
+    'twitter': 'https://twitter.com/bbaggins',
+    'facebook': 'https://www.facebook.com/bbaggins',
+    'linkedin': 'https://www.linkedin.com/in/bbaggins',
+    'bio': 'Hobbit of the Shire, ring-bearer and author of There and Back Again.',
+    'avatar': 'https://example.com/bbaggins.png',
+    'details': {
+        'name': {'given': 'Bilbo', 'family': 'Baggins', 'full': 'Bilbo Baggins'},
+        'emails': [{'label': 'work', 'value': 'bbaggins@shire.com'}],
+        'profiles': {'linkedin': {'username': 'bbaggins', 'service': 'linkedin'}},
+        'employment': [{'name': 'Thorin and Company', 'current': True, 'title': 'Burglar', 'start': {'year': 2941}}],
+        'photos': [{'label': 'avatar', 'value': 'https://example.com/bbaggins.png'}] * 5,
+        'education': [],
+        'urls': [],
+        'interests': [{'name': 'Maps', 'affinity': 'HIGH'}] * 20
+    }
+}
+
+COMPANY = {
+    'name': 'Thorin and Company',
+    'location': 'The Lonely Mountain',
+    'twitter': 'https://twitter.com/thorinandco',
+    'linkedin': 'https://www.linkedin.com/company/thorinandco',
+    'bio': 'A company of dwarves (and one hobbit).',
+    'logo': 'https://example.com/thorinandco.png',
+    'website': 'https://thorinandco.example.com',
+    'founded': 2941,
+    'employees': 14,
+    'locale': 'en',
+    'category': 'Other',
+    'details': {
+        'locations': [{'city': 'Erebor', 'country': 'Wilderland'}],
+        'keyPeople': [{'name': 'Thorin Oakenshield', 'title': 'King'}] * 13
+    }
+}
+
+def parse_mix(value):
+    # parse a mix like "200=90,404=8,429=2" into a dictionary of status
+    # codes and weights
+    mix = {}
+    for item in value.split(','):
+        status, weight = item.split('=')
+        mix[int(status)] = float(weight)
+    return mix
+
+class StubServer:
+
+    def __init__(self, port=0, latency=0.0, jitter=0.0, mix=None, retry_after=0.05, capacity=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.retry_after = retry_after
+        self.capacity = capacity
+        self.slots = threading.Semaphore(capacity) if capacity > 0 else None
+        self.in_flight = 0
+        self.set_mix(mix or DEFAULT_MIX)
+        self.counts = {}
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), self.create_handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d/v3' % self.server.server_address[1]
+
+    def set_mix(self, mix):
+        total = float(sum(mix.values()))
+        self.transient = [(status, weight/total) for status, weight in mix.items() if status == 429 or status >= 500]
+        self.stable = [(status, weight/total) for status, weight in mix.items() if not (status == 429 or status >= 500)]
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def count(self, status):
+        with self.lock:
+            self.counts[status] = self.counts.get(status, 0) + 1
+
+    def enter(self):
+        # count a request in, unless the server (and its queue) is full
+        with self.lock:
+            if self.in_flight >= self.capacity*2:
+                return False
+            self.in_flight += 1
+            return True
+
+    def leave(self):
+        with self.lock:
+            self.in_flight -= 1
+
+    def choose_status(self, body):
+        # transient errors are chosen at random for each request
+        r = random.random()
+        for status, weight in self.transient:
+            if r < weight:
+                return status
+            r -= weight
+
+        # other results are chosen from a hash of the request so they're the
+        # same each time the same lookup is made
+        total = sum(weight for status, weight in self.stable)
+        r = int(hashlib.md5(body).hexdigest()[:8], 16) / float(0xffffffff) * total
+        for status, weight in self.stable:
+            if r < weight:
+                return status
+            r -= weight
+        return 200
+
+    def create_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def wait(self):
+                if stub.latency > 0 or stub.jitter > 0:
+                    time.sleep(max(stub.latency + random.uniform(-stub.jitter, stub.jitter), 0))
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if stub.slots is None:
+                    self.wait()
+                    status = stub.choose_status(body)
+                elif stub.enter():
+                    try:
+                        with stub.slots:
+                            self.wait()
+                    finally:
+                        stub.leave()
+                    status = stub.choose_status(body)
+                else:
+                    status = 429
+
+                stub.count(status)
+                headers = {}
+                if status == 200:
+                    content = PERSON if self.path.endswith('/person.enrich') else COMPANY
+                elif status == 202:
+                    content = {'status': 202, 'message': 'Queued for search. Please retry your query within the next few minutes.'}
+                elif status == 429:
+                    content = {'status': 429, 'message': 'Usage limits exceeded.'}
+                    headers = {'Retry-After': str(stub.retry_after), 'X-Rate-Limit-Remaining': '0', 'X-Rate-Limit-Reset': str(stub.retry_after)}
+                else:
+                    content = {'status': status, 'message': 'Stub response.'}
+                if not (self.path.endswith('/person.enrich') or self.path.endswith('/company.enrich')):
+                    status, content = 404, {'status': 404, 'message': 'Unknown endpoint.'}
+
+                data = json.dumps(content).encode('utf-8')
+                try:
+                    self.send_response(status)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(data)))
+                    for name, value in headers.items():
+                        self.send_header(name, value)
+                    self.end_headers()
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    # the client gave up waiting (e.g. it ran out of time)
+                    self.close_connection = True
+
+        return Handler
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a local stand-in for the FullContact API')
+    parser.add_argument('--port', type=int, default=8080, help='the port to listen on')
+    parser.add_argument('--latency', type=float, default=50, help='the response latency in milliseconds')
+    parser.add_argument('--jitter', type=float, default=0, help='the random variation in latency in milliseconds')
+    parser.add_argument('--mix', default='200=100', help='the weights of the response status codes, e.g. "200=90,404=8,429=2"')
+    parser.add_argument('--capacity', type=int, default=0, help='the number of requests the server can handle at a time (0 for no limit)')
+    args = parser.parse_args()
+
+    stub = StubServer(args.port, args.latency/1000.0, args.jitter/1000.0, parse_mix(args.mix), capacity=args.capacity)
+    print('Serving on ' + stub.url + ' (set FULLCONTACT_API_URL to this url)')
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+# throughput benchmark for the FullContact functions; runs each function's
+# flexio_handler against the local stub server and reports rows per second,
+# latency percentiles for each handler call and memory allocated, for:
+#
+#   single:  one handler call per row, as when each cell has its own formula
+#   batched: one handler call for each batch of rows (a range of values)
+#   cached:  the batched calls again, with the results already cached
+#
+# usage: python benchmarks/throughput.py [--rows N] [--batch-size N] [--latency MS] [--mix 200=90,404=10] [--time-budget S] [--json]
+#
+# with --json, the results are printed as JSON so they can be compared
+# between runs (e.g. to catch regressions in CI)
+
+import os
+import json
+import time
+import argparse
+import tracemalloc
+
+# don't let the client-side rate limiter slow the benchmark down unless asked
+os.environ.setdefault('FULLCONTACT_RATE_LIMIT', '1000000')
+os.environ.setdefault('FULLCONTACT_RATE_LIMIT_BURST', '1000000')
+
+from harness import Flex, load_function, reset_state
+from stub_server import StubServer, parse_mix
+
+FUNCTIONS = ['fullcontact-enrich-people', 'fullcontact-enrich-org', 'fullcontact-enrich-people-org', 'fullcontact-find-person']
+
+def get_values(name, count):
+    # return the input values for the function's rows
+    if name == 'fullcontact-enrich-org':
+        return ['company%d.example.com' % i for i in range(count)]
+    return ['person%d@example.com' % i for i in range(count)]
+
+def get_calls(name, mode, rows, batch_size):
+    # return the input for each handler call
+    values = get_values(name, rows)
+    if name == 'fullcontact-find-person':
+        profiles = ['person%d' % i for i in range(rows)]
+        if mode == 'single':
+            return [[value, profile] for value, profile in zip(values, profiles)]
+        return [[[[value] for value in values[i:i+batch_size]], [[profile] for profile in profiles[i:i+batch_size]]] for i in range(0, len(values), batch_size)]
+    if mode == 'single':
+        return [[value] for value in values]
+    return [[[[value] for value in values[i:i+batch_size]]] for i in range(0, len(values), batch_size)]
+
+def percentile(values, p):
+    values = sorted(values)
+    if len(values) == 0:
+        return 0.0
+    index = min(int(round(p / 100.0 * (len(values) - 1))), len(values) - 1)
+    return values[index]
+
+def run_calls(module, calls, vars):
+    latencies = []
+    errors = 0
+    timed_out = 0
+    start = time.perf_counter()
+    for input in calls:
+        call_start = time.perf_counter()
+        flex = Flex(input, vars)
+        try:
+            module.flexio_handler(flex)
+        except Exception:
+            errors += 1
+        latencies.append(time.perf_counter() - call_start)
+        timed_out += ''.join(flex.output.written).count('"Timed Out"')
+    return time.perf_counter() - start, latencies, errors, timed_out
+
+def run_mode(module, name, mode, rows, batch_size, vars):
+    calls = get_calls(name, mode, rows, batch_size)
+
+    # the cached mode runs the batched calls once to fill the cache
+    reset_state()
+    if mode == 'cached':
+        run_calls(module, calls, vars)
+
+    elapsed, latencies, errors, timed_out = run_calls(module, calls, vars)
+
+    # measure the memory allocated by running the calls again with tracing
+    # on (tracing slows the calls down, so this isn't part of the timing)
+    if mode != 'cached':
+        reset_state()
+    tracemalloc.start()
+    run_calls(module, calls, vars)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'function': name,
+        'mode': mode,
+        'rows': rows,
+        'calls': len(calls),
+        'errors': errors,
+        'timed_out': timed_out,
+        'rows_per_sec': rows / elapsed if elapsed > 0 else 0.0,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'peak_alloc_kb': peak / 1024.0
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the FullContact functions against a local stub server')
+    parser.add_argument('--rows', type=int, default=500, help='number of rows to look up for each function and mode')
+    parser.add_argument('--batch-size', type=int, default=100, help='number of rows in each batched call')
+    parser.add_argument('--latency', type=float, default=20, help='the stub server latency in milliseconds')
+    parser.add_argument('--jitter', type=float, default=5, help='the random variation in latency in milliseconds')
+    parser.add_argument('--mix', default='200=90,404=5,422=3,202=2', help='the weights of the stub response status codes')
+    parser.add_argument('--function', action='append', choices=FUNCTIONS, help='the function(s) to benchmark (defaults to all)')
+    parser.add_argument('--mode', action='append', choices=['single', 'batched', 'cached'], help='the mode(s) to benchmark (defaults to all)')
+    parser.add_argument('--time-budget', type=float, help='the time budget for each call in seconds (defaults to the functions\' default)')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    args = parser.parse_args()
+
+    stub = StubServer(latency=args.latency/1000.0, jitter=args.jitter/1000.0, mix=parse_mix(args.mix)).start()
+    os.environ['FULLCONTACT_API_URL'] = stub.url
+    import fullcontact_core
+    fullcontact_core.API_URL = stub.url
+
+    vars = {'fullcontact_api_key': 'benchmark'}
+    if args.time_budget is not None:
+        vars['fullcontact_time_budget'] = args.time_budget
+
+    results = []
+    try:
+        for name in args.function or FUNCTIONS:
+            module = load_function(name)
+            for mode in args.mode or ['single', 'batched', 'cached']:
+                results.append(run_mode(module, name, mode, args.rows, args.batch_size, vars))
+    finally:
+        stub.stop()
+
+    if args.json:
+        print(json.dumps({'results': results, 'stub': {str(k): v for k, v in stub.counts.items()}}, indent=2))
+        return
+
+    print('%-30s %-8s %8s %8s %9s %12s %9s %9s %9s %12s' % ('function', 'mode', 'calls', 'errors', 'timed out', 'rows/sec', 'p50 ms', 'p95 ms', 'p99 ms', 'peak KiB'))
+    for r in results:
+        print('%-30s %-8s %8d %8d %9d %12.1f %9.2f %9.2f %9.2f %12.1f' % (
+            r['function'], r['mode'], r['calls'], r['errors'], r['timed_out'], r['rows_per_sec'], r['p50_ms'], r['p95_ms'], r['p99_ms'], r['peak_alloc_kb']))
+
+if __name__ == '__main__':
+    main()
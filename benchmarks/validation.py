@@ -0,0 +1,80 @@
+# validation microbenchmark for the FullContact functions; compares the
+# precompiled input validator in fullcontact_core with the cerberus validator
+# the functions used to create on each call, for single calls and for a
+# batch of rows validated in one pass (cerberus must be installed)
+#
+# usage: python benchmarks/validation.py [--rows N]
+
+import os
+import sys
+import time
+import argparse
+from collections import OrderedDict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from cerberus import Validator
+from fullcontact_core import InputValidator, validator_list, to_list
+
+def get_params():
+    params = OrderedDict()
+    params['email'] = {'required': True, 'type': 'string'}
+    params['profile'] = {'required': True, 'type': 'string'}
+    params['properties'] = {'required': False, 'validator': validator_list, 'coerce': to_list, 'default': '*'}
+    return params
+
+def cerberus_per_call(rows):
+    # what each call did before: create a validator and validate one row
+    params = get_params()
+    for row in rows:
+        v = Validator(params, allow_unknown = True)
+        v.validated(dict(zip(params.keys(), row)))
+
+def cerberus_reused(rows):
+    params = get_params()
+    v = Validator(params, allow_unknown = True)
+    for row in rows:
+        v.validated(dict(zip(params.keys(), row)))
+
+def precompiled_per_call(rows):
+    validator = InputValidator(get_params())
+    for row in rows:
+        validator.validated(row)
+
+def precompiled_batch(rows):
+    validator = InputValidator(get_params())
+    validator.validated_rows(rows)
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the precompiled input validator with cerberus')
+    parser.add_argument('--rows', type=int, default=20000, help='number of rows to validate')
+    args = parser.parse_args()
+
+    rows = [
+        ['user%d@example.com' % i, 'user%d' % i, 'full_name, title, bio'] if i % 2 else ['user%d@example.com' % i, '']
+        for i in range(args.rows)
+    ]
+
+    # make sure both validators agree before timing them
+    params = get_params()
+    v = Validator(params, allow_unknown = True)
+    validator = InputValidator(params)
+    for row in rows[:1000]:
+        if validator.validated(row) != v.validated(dict(zip(params.keys(), row))):
+            raise AssertionError('Validators disagree on row: ' + repr(row))
+
+    print('%-24s %14s %14s' % ('validator', 'total (ms)', 'per row (us)'))
+    for name, fn in [
+        ('cerberus (per call)', cerberus_per_call),
+        ('cerberus (reused)', cerberus_reused),
+        ('precompiled', precompiled_per_call),
+        ('precompiled (batch)', precompiled_batch)
+    ]:
+        start = time.perf_counter()
+        fn(rows)
+        elapsed = time.perf_counter() - start
+        print('%-24s %14.2f %14.2f' % (name, elapsed*1000, elapsed/len(rows)*1000000))
+
+if __name__ == '__main__':
+    main()
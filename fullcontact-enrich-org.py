@@ -7,11 +7,11 @@
 # params:
 #   - name: domain
 #     type: string
-#     description: The domain name of the organization from which you want to retrieve information. For example, "apple.com".
+#     description: The domain name of the organization from which you want to retrieve information, or a range of domain names to retrieve information for each one. For example, "apple.com".
 #     required: true
 #   - name: properties
 #     type: array
-#     description: The properties to return (defaults to all properties). See "Returns" for a listing of the available properties.
+#     description: The properties to return (defaults to all properties). See "Returns" for a listing of the available properties. Other fields of the company response can be returned using their path (the names are case-sensitive), for example "details.keyPeople" or "details.locations".
 #     required: false
 # returns:
 #   - name: name
@@ -53,153 +53,57 @@
 #   - '"fullcontact.com", "website, logo, founded, employees"'
 # ---
 
-import json
-import urllib
-import requests
-from requests.adapters import HTTPAdapter
-from requests.packages.urllib3.util.retry import Retry
-import itertools
-from datetime import *
-from cerberus import Validator
 from collections import OrderedDict
+from fullcontact_core import InputValidator, COMPANY_PROPERTY_MAP, get_auth_token, get_concurrency, get_time_budget, set_deadline, set_raise_errors, get_properties, get_projection, get_max_age, refresh_rows, run_lookups, unique_lookups, normalize_values, normalize_domain, enrich_org, write_rows, validator_list, to_list, to_range
+
+# define the expected parameters; the values are mapped to the parameter names
+# based on the positions of the keys/values; the domain may either be a
+# single value or a range of values (e.g. a column of domains)
+params = OrderedDict()
+params['domain'] = {'required': True, 'validator': validator_list, 'coerce': to_range}
+params['properties'] = {'required': False, 'validator': validator_list, 'coerce': to_list, 'default': '*'}
+validator = InputValidator(params)
 
 # main function entry point
 def flexio_handler(flex):
 
-    # get the api key from the variable input
-    auth_token = dict(flex.vars).get('fullcontact_api_key')
-    if auth_token is None:
-        raise ValueError
-
-    # get the input
-    input = flex.input.read()
-    try:
-        input = json.loads(input)
-        if not isinstance(input, list): raise ValueError
-    except ValueError:
-        raise ValueError
-
-    # define the expected parameters and map the values to the parameter names
-    # based on the positions of the keys/values
-    params = OrderedDict()
-    params['domain'] = {'required': True, 'type': 'string'}
-    params['properties'] = {'required': False, 'validator': validator_list, 'coerce': to_list, 'default': '*'}
-    input = dict(zip(params.keys(), input))
-
-    # validate the mapped input against the validator
-    # if the input is valid return an error
-    v = Validator(params, allow_unknown = True)
-    input = v.validated(input)
-    if input is None:
-        raise ValueError
-
-    # map this function's property names to the API's property names
-    property_map = OrderedDict()
-    property_map['name'] = 'name'
-    property_map['location'] = 'location'
-    property_map['twitter_url'] = 'twitter'
-    property_map['linkedin_url'] = 'linkedin'
-    property_map['bio'] = 'bio'
-    property_map['logo'] = 'logo'
-    property_map['website'] = 'website'
-    property_map['founded'] = 'founded'
-    property_map['employees'] = 'employees'
-    property_map['locale'] = 'locale'
-    property_map['category'] = 'category'
-
-    # get the properties to return and the property map
-    properties = [p.lower().strip() for p in input['properties']]
-
-    # if we have a wildcard, get all the properties
-    if len(properties) == 1 and properties[0] == '*':
-        properties = list(property_map.keys())
-
-    # see here for more info:
-    # https://docs.fullcontact.com/#company-enrichment
-    # https://dashboard.fullcontact.com/api-ref#response-codes-&-errors
-
-    data = json.dumps({
-        'domain': input['domain'].lower().strip()
-    })
-    headers = {
-        'Content-Type': 'application/json',
-        'Authorization': 'Bearer ' + auth_token
-    }
-    url = 'https://api.fullcontact.com/v3/company.enrich'
+    # start the time budget for the call; lookups that can't finish in
+    # time are returned as timed out along with the rows that did finish
+    set_deadline(get_time_budget(flex))
 
-    # get the response data as a JSON object
-    response = requests_retry_session().post(url, data=data, headers=headers)
-
-    # sometimes results are pending; for these, return text indicating
-    # the result is pending so the user can refresh later to look for
-    # the completed result
-    status_code = response.status_code
-    if status_code == 202:
-        flex.output.content_type = "application/json"
-        flex.output.write([['Result Pending...']])
-        return
-
-    # if a result can't be found or wasn't formatted properly,
-    # return a blank (equivalent to not finding a bad email address)
-    if status_code == 400 or status_code == 404 or status_code == 422:
-        flex.output.content_type = "application/json"
-        flex.output.write([['']])
-        return
-
-    # return an error for any other non-200 result
-    response.raise_for_status()
-
-    # limit the results to the requested properties
-    content = response.json()
-    properties = [content.get(property_map.get(p,''),'') or '' for p in properties]
-    result = [properties]
+    # get the api key from the variable input
+    auth_token = get_auth_token(flex)
+
+    # get the input and validate it against the expected parameters
+    input = validator.read(flex)
+
+    # a single value that fails raises its error; in a range, the rows that
+    # fail are returned as errors along with the rows that didn't
+    set_raise_errors(len(input['domain']) == 1)
+
+    # get the properties to return and the function that limits each
+    # result to them
+    properties = get_properties(input['properties'], COMPANY_PROPERTY_MAP)
+    projection = get_projection(properties, COMPANY_PROPERTY_MAP)
+
+    # look up each of the domains concurrently; the results are returned
+    # in the same order as the input, one row per domain, and are written
+    # a chunk at a time as each chunk of lookups is done
+    max_concurrency = get_concurrency(flex)
+    max_age = get_max_age(flex)
+    lookup = lambda domain: enrich_org(auth_token, domain, projection)
+
+    # normalize the domains first so ones that can't be valid are returned as
+    # blanks without calling the API, and ones that only differ in form
+    # are looked up once
+    domains = normalize_values(input['domain'], normalize_domain)
+    if max_age > 0:
+        # on an incremental refresh, only the rows that are new, edited,
+        # stale or weren't complete are looked up
+        lookup_rows = lambda values: run_lookups(lookup, values, max_concurrency)
+        result = refresh_rows(auth_token, 'enrich-org', domains, properties, max_age, lookup_rows)
+    else:
+        result = unique_lookups(lookup, domains, max_concurrency)
 
     # return the results
-    result = json.dumps(result, default=to_string)
-    flex.output.content_type = "application/json"
-    flex.output.write(result)
-
-def requests_retry_session(
-    retries=3,
-    backoff_factor=0.3,
-    status_forcelist=(429, 500, 502, 503, 504),
-    session=None,
-):
-    session = session or requests.Session()
-    retry = Retry(
-        total=retries,
-        read=retries,
-        connect=retries,
-        backoff_factor=backoff_factor,
-        status_forcelist=status_forcelist,
-    )
-    adapter = HTTPAdapter(max_retries=retry)
-    session.mount('http://', adapter)
-    session.mount('https://', adapter)
-    return session
-
-def validator_list(field, value, error):
-    if isinstance(value, str):
-        return
-    if isinstance(value, list):
-        for item in value:
-            if not isinstance(item, str):
-                error(field, 'Must be a list with only string values')
-        return
-    error(field, 'Must be a string or a list of strings')
-
-def to_string(value):
-    if isinstance(value, (date, datetime)):
-        return value.isoformat()
-    if isinstance(value, (Decimal)):
-        return str(value)
-    return value
-
-def to_list(value):
-    # if we have a list of strings, create a list from them; if we have
-    # a list of lists, flatten it into a single list of strings
-    if isinstance(value, str):
-        return value.split(",")
-    if isinstance(value, list):
-        return list(itertools.chain.from_iterable(value))
-    return None
+    write_rows(flex, result, len(properties))
@@ -0,0 +1,147 @@
+# ---
+# name: fullcontact-enrich-people-org
+# deployed: true
+# title: FullContact People and Organization Enrichment
+# description: Return a person's profile information and information about the organization at their email domain based on their email address.
+# params:
+#   - name: email
+#     type: string
+#     description: The email address of the person you wish you find, or a range of email addresses to find a person and organization for each one. Each organization is only looked up once, no matter how many of the people share its domain.
+#     required: true
+#   - name: properties
+#     type: array
+#     description: The person properties to return (defaults to all properties). See "Returns" for a listing of the available properties. Other fields of the FullContact response can be returned using their path, for example "details.employment".
+#     required: false
+#   - name: org_properties
+#     type: array
+#     description: The organization properties to return after the person properties (defaults to all properties). See "Returns" for a listing of the available properties marked (Organization). Other fields of the company response can be returned using their path, for example "details.keyPeople".
+#     required: false
+# returns:
+#   - name: full_name
+#     type: string
+#     description: The full name of the person (default)
+#   - name: age_range
+#     type: string
+#     description: The age range of the person
+#   - name: gender
+#     type: string
+#     description: The gender of the person
+#   - name: location
+#     type: string
+#     description: The location of the person (varies depending on data quality)
+#   - name: title
+#     type: string
+#     description: The current or most recent job title of the person
+#   - name: organization
+#     type: string
+#     description: The current or most recent place of work of the person
+#   - name: twitter_url
+#     type: string
+#     description: The URL of the person's Twitter profile
+#   - name: facebook_url
+#     type: string
+#     description: The URL of the person's Facebook profile
+#   - name: linkedin_url
+#     type: string
+#     description: The URL of the person's LinkedIn profile
+#   - name: bio
+#     type: string
+#     description: A biography of the person
+#   - name: avatar_url
+#     type: string
+#     description: The URL of the person's photo
+#   - name: name
+#     type: string
+#     description: (Organization) The name of the organization
+#   - name: location
+#     type: string
+#     description: (Organization) The location or address of the organization
+#   - name: twitter_url
+#     type: string
+#     description: (Organization) The URL of the organization's Twitter profile
+#   - name: linkedin_url
+#     type: string
+#     description: (Organization) The URL of the organization's LinkedIn profile
+#   - name: bio
+#     type: string
+#     description: (Organization) A biography of the organization
+#   - name: logo
+#     type: string
+#     description: (Organization) The URL of the organization's logo
+#   - name: website
+#     type: string
+#     description: (Organization) The URL of the organization's website
+#   - name: founded
+#     type: string
+#     description: (Organization) The year the organization was founded
+#   - name: employees
+#     type: string
+#     description: (Organization) The approximate number of employees in the organization
+#   - name: locale
+#     type: string
+#     description: (Organization) The locale of the organization
+#   - name: category
+#     type: string
+#     description: (Organization) The category of the organization; possible values are **Adult**, **Email Provider**, **Education**, **SMS**, or **Other**
+# examples:
+#   - '"tcook@apple.com"'
+#   - '"jeff@amazon.com", "full_name, title", "name, employees"'
+# ---
+
+from collections import OrderedDict
+from fullcontact_core import InputValidator, PERSON_PROPERTY_MAP, COMPANY_PROPERTY_MAP, get_auth_token, get_concurrency, get_time_budget, set_deadline, set_raise_errors, get_properties, get_projection, get_max_age, refresh_rows, enrich_people_orgs, normalize_values, normalize_email, write_rows, validator_list, to_list, to_range
+
+# define the expected parameters; the values are mapped to the parameter names
+# based on the positions of the keys/values; the email may either be a
+# single value or a range of values (e.g. a column of email addresses)
+params = OrderedDict()
+params['email'] = {'required': True, 'validator': validator_list, 'coerce': to_range}
+params['properties'] = {'required': False, 'validator': validator_list, 'coerce': to_list, 'default': '*'}
+params['org_properties'] = {'required': False, 'validator': validator_list, 'coerce': to_list, 'default': '*'}
+validator = InputValidator(params)
+
+# main function entry point
+def flexio_handler(flex):
+
+    # start the time budget for the call; lookups that can't finish in
+    # time are returned as timed out along with the rows that did finish
+    set_deadline(get_time_budget(flex))
+
+    # get the api key from the variable input
+    auth_token = get_auth_token(flex)
+
+    # get the input and validate it against the expected parameters
+    input = validator.read(flex)
+
+    # a single value that fails raises its error; in a range, the rows that
+    # fail are returned as errors along with the rows that didn't
+    set_raise_errors(len(input['email']) == 1)
+
+    # get the person and organization properties to return and the
+    # functions that limit each result to them
+    properties = get_properties(input['properties'], PERSON_PROPERTY_MAP)
+    projection = get_projection(properties, PERSON_PROPERTY_MAP)
+    org_properties = get_properties(input['org_properties'], COMPANY_PROPERTY_MAP)
+    org_projection = get_projection(org_properties, COMPANY_PROPERTY_MAP)
+
+    # look up each of the people and the organizations at their domains
+    # concurrently; the results are returned in the same order as the
+    # input, one row per email with the organization columns after the
+    # person columns
+    max_concurrency = get_concurrency(flex)
+    max_age = get_max_age(flex)
+    lookup_rows = lambda emails: enrich_people_orgs(auth_token, emails, projection, len(properties), org_projection, max_concurrency)
+
+    # normalize the emails first so ones that can't be valid are returned as
+    # blanks without calling the API, and ones that only differ in form
+    # are looked up once
+    emails = normalize_values(input['email'], normalize_email)
+    if max_age > 0:
+        # on an incremental refresh, only the rows that are new, edited,
+        # stale or weren't complete are looked up
+        result = refresh_rows(auth_token, 'enrich-people-org', emails, properties + ['org:' + p for p in org_properties], max_age, lookup_rows)
+    else:
+        result = lookup_rows(emails)
+
+    # return the results
+    write_rows(flex, result, len(properties) + len(org_properties))
@@ -0,0 +1,604 @@
+# command-line runner for enriching large CSV or JSONL files with the
+# FullContact functions; rows are read and written as a stream in chunks, the
+# lookups in each chunk are run concurrently (with the same engine, cache and
+# rate limiter as the functions) and progress is checkpointed after each chunk
+# so an interrupted run can be resumed without looking up the same rows again;
+# the input values are normalized first, so values that can't be valid and
+# rows that repeat others (e.g. in a different case or as a mailto: link or
+# website url) don't cost an API call, and the number of lookups avoided is
+# reported at the end
+#
+# with --workers, the input is split into a shard for each worker process by
+# a hash of the normalized email or domain, the shards are enriched in
+# parallel (each worker with its own connections) and the shard
+# outputs are merged back in the original row order
+#
+# usage:
+#   python fullcontact_bulk.py enrich-people emails.csv enriched.csv --properties "full_name, title"
+#   python fullcontact_bulk.py enrich-org domains.jsonl orgs.jsonl --column website
+#   python fullcontact_bulk.py find-person people.csv found.csv --column email --column linkedin
+#   python fullcontact_bulk.py enrich-people-org emails.csv enriched.csv --org-properties "name, employees"
+#   python fullcontact_bulk.py enrich-people emails.csv enriched.csv --workers 8
+#   python fullcontact_bulk.py enrich-people emails.csv enriched.csv --adaptive-concurrency 64
+#
+# with --adaptive-concurrency, the number of requests in flight (in each
+# worker process) grows while the API keeps up and backs off on 429s, server
+# errors and timeouts, up to the given maximum, instead of staying fixed
+#
+# with a columnar output format (columns, or parquet and arrow with pyarrow
+# installed), the results are written by column rather than by row, with
+# the values repeated down a column (organizations, locations, genders and
+# so on) stored once in a dictionary and each row as an index into it:
+#   python fullcontact_bulk.py enrich-people emails.csv enriched.parquet
+#   python fullcontact_bulk.py enrich-people emails.csv enriched.json --output-format columns
+#
+# the api key is read from the FULLCONTACT_API_KEY environment variable
+# unless it's given with --api-key
+
+import os
+import sys
+import csv
+import zlib
+import json
+import array
+import argparse
+import itertools
+from collections import OrderedDict
+from fullcontact_core import PERSON_PROPERTY_MAP, COMPANY_PROPERTY_MAP, DEFAULT_CONCURRENCY, enable_adaptive_concurrency, get_concurrency_limiter, get_properties, get_projection, run_lookups, enrich_person, enrich_org, enrich_people_orgs, find_people, to_list, dumps, normalize_email, normalize_domain, normalize_profile, normalize_rows, dedupe_values, expand_rows
+
+# the input columns and property map for each function
+FUNCTIONS = {
+    'enrich-people': (['email'], PERSON_PROPERTY_MAP),
+    'enrich-org': (['domain'], COMPANY_PROPERTY_MAP),
+    'find-person': (['email', 'profile'], PERSON_PROPERTY_MAP),
+    'enrich-people-org': (['email'], PERSON_PROPERTY_MAP)
+}
+
+# the normalization for each input column of each function; the values in
+# each chunk are normalized and deduplicated before they're looked up, so
+# values that can't be valid (and rows that repeat another row in a
+# different form) don't cost an API call
+NORMALIZERS = {
+    'enrich-people': [normalize_email],
+    'enrich-org': [normalize_domain],
+    'find-person': [normalize_email, normalize_profile],
+    'enrich-people-org': [normalize_email]
+}
+
+# the organization columns added by enrich-people-org are prefixed so they
+# don't clash with the person columns (e.g. location)
+ORG_COLUMN_PREFIX = 'org_'
+
+# the added columns that have the same name as an input column (e.g. an
+# input location column) are prefixed so they don't overwrite the input
+OUTPUT_COLUMN_PREFIX = 'fullcontact_'
+
+# number of rows to look up before writing them and saving a checkpoint
+DEFAULT_CHUNK_SIZE = 1000
+
+# the columnar output formats; the rows are written to a JSONL spool file
+# (so a run can be checkpointed and resumed as usual) and when the run is
+# complete, they're read into a table of columns in memory and written out
+# as JSON columns, Parquet or an Arrow IPC file (both of which need pyarrow)
+COLUMNAR_FORMATS = ('columns', 'parquet', 'arrow')
+
+# a column keeps a dictionary of its distinct values (once it has this many
+# rows) only while they're at most this fraction of its rows; columns with
+# mostly distinct values (like emails) are kept as plain lists instead
+DICTIONARY_MIN_ROWS = 1000
+DICTIONARY_MAX_RATIO = 0.5
+
+def get_lookup(function, auth_token, projection, max_concurrency, width=None, org_projection=None):
+    # return a function that looks up a chunk of rows from their input values
+    if function == 'enrich-people':
+        return lambda rows: run_lookups(lambda values: enrich_person(auth_token, values[0], projection), rows, max_concurrency)
+    if function == 'enrich-org':
+        return lambda rows: run_lookups(lambda values: enrich_org(auth_token, values[0], projection), rows, max_concurrency)
+    if function == 'find-person':
+        return lambda rows: find_people(auth_token, rows, projection, max_concurrency)
+    if function == 'enrich-people-org':
+        return lambda rows: enrich_people_orgs(auth_token, [values[0] for values in rows], projection, width, org_projection, max_concurrency)
+    raise ValueError('Unknown function: ' + function)
+
+def get_format(path, format):
+    if format is not None:
+        return format
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.parquet':
+        return 'parquet'
+    if extension in ('.arrow', '.feather'):
+        return 'arrow'
+    return 'jsonl' if extension in ('.jsonl', '.ndjson', '.json') else 'csv'
+
+def open_input(path):
+    # open an input file; a byte order mark (e.g. from an Excel export) is
+    # skipped so it isn't read as part of the first column name
+    return open(path, newline='', encoding='utf-8-sig')
+
+def check_columns(path, format, columns):
+    # check the columns to look up are in the header of a CSV before any
+    # lookups, so a missing or mistyped column is an error rather than a
+    # run of blank lookups
+    if format != 'csv':
+        return
+    with open_input(path) as input:
+        fieldnames = csv.DictReader(input).fieldnames
+    if fieldnames is None:
+        return
+    missing = [column for column in columns if column not in fieldnames]
+    if len(missing) > 0:
+        raise ValueError('Input column(s) not found: %s (the columns are: %s)' % (', '.join(missing), ', '.join(fieldnames)))
+
+def read_records(file, format):
+    # yield each input row as a dictionary
+    if format == 'csv':
+        for record in csv.DictReader(file):
+            yield record
+        return
+    for line in file:
+        line = line.strip()
+        if len(line) > 0:
+            yield json.loads(line)
+
+def get_values(record, columns):
+    # get the values to look up from the input row
+    values = []
+    for column in columns:
+        value = record.get(column)
+        values.append('' if value is None else str(value))
+    return values
+
+def get_output_columns(properties, record):
+    # return the names of the columns the properties are added to a row as;
+    # every row of a CSV has the same columns, so they get the same names,
+    # while JSONL rows are each named by their own columns
+    names = []
+    for name in properties:
+        while name in record:
+            name = OUTPUT_COLUMN_PREFIX + name
+        names.append(name)
+    return names
+
+def read_checkpoint(path):
+    # return the number of input rows that are done and the size of the
+    # output when they were done
+    try:
+        with open(path) as f:
+            checkpoint = json.load(f)
+        return checkpoint['rows'], checkpoint['offset']
+    except FileNotFoundError:
+        return 0, None
+
+def write_checkpoint(path, rows, offset):
+    # write the checkpoint to a temporary file first so an interrupted write
+    # never leaves a partial checkpoint
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump({'rows': rows, 'offset': offset}, f)
+    os.replace(temp_path, path)
+
+class Column:
+    # a column of values; repeated values are stored once in a dictionary
+    # and each row is an index into it (-1 for a missing value), so a
+    # million rows of the same few organizations, locations or genders take
+    # 4 bytes a row; if the values turn out to be mostly distinct, or can't
+    # be dictionary keys, the column switches to a plain list of values
+
+    def __init__(self, rows=0):
+        self.dictionary = []
+        self.lookup = {}
+        self.indexes = array.array('i', [-1]) * rows
+        self.values = None
+
+    def __len__(self):
+        return len(self.indexes) if self.values is None else len(self.values)
+
+    def append(self, value):
+        if self.values is not None:
+            self.values.append(value)
+            return
+        if value is None:
+            self.indexes.append(-1)
+            return
+        # values are keyed by their type as well, since equal values of
+        # different types (e.g. True, 1 and 1.0) are distinct values here
+        key = (type(value), value)
+        try:
+            index = self.lookup.get(key)
+        except TypeError:
+            self.to_plain()
+            self.values.append(value)
+            return
+        if index is None:
+            if isinstance(value, str):
+                value = sys.intern(value)
+            index = self.lookup[key] = len(self.dictionary)
+            self.dictionary.append(value)
+        self.indexes.append(index)
+        if len(self.indexes) >= DICTIONARY_MIN_ROWS and len(self.dictionary) > len(self.indexes) * DICTIONARY_MAX_RATIO:
+            self.to_plain()
+
+    def to_plain(self):
+        self.values = [self.dictionary[index] if index >= 0 else None for index in self.indexes]
+        self.dictionary, self.lookup, self.indexes = None, None, None
+
+    def to_json(self, name):
+        if self.values is not None:
+            return {'name': name, 'values': self.values}
+        return {'name': name, 'dictionary': self.dictionary, 'indexes': self.indexes.tolist()}
+
+    def to_arrow(self):
+        import pyarrow
+        if self.values is not None:
+            return to_arrow_array(self.values)
+        indexes = pyarrow.array([index if index >= 0 else None for index in self.indexes], type=pyarrow.int32())
+        return pyarrow.DictionaryArray.from_arrays(indexes, to_arrow_array(self.dictionary))
+
+def to_arrow_array(values):
+    # the values of a column are usually all strings; if they're a mix of
+    # types (e.g. from JSONL input), store them as strings
+    import pyarrow
+    try:
+        return pyarrow.array(values)
+    except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError):
+        return pyarrow.array([None if value is None else (value if isinstance(value, str) else dumps(value)) for value in values])
+
+class Table:
+    # a table of rows stored as columns; the columns are in the order their
+    # names first appear in the rows, and rows without a column are missing
+    # a value for it
+
+    def __init__(self):
+        self.columns = OrderedDict()
+        self.rows = 0
+
+    def append(self, record):
+        for name, value in record.items():
+            column = self.columns.get(name)
+            if column is None:
+                column = self.columns[name] = Column(self.rows)
+            column.append(value)
+        self.rows += 1
+        for column in self.columns.values():
+            if len(column) < self.rows:
+                column.append(None)
+
+    def write(self, path, format):
+        # write the table as JSON columns (each either a dictionary with an
+        # index for each row, or a list of values), Parquet or Arrow
+        if format == 'columns':
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write('{"rows":%d,"columns":[' % self.rows)
+                for index, (name, column) in enumerate(self.columns.items()):
+                    if index > 0:
+                        f.write(',')
+                    f.write(dumps(column.to_json(name)))
+                f.write(']}')
+            return
+
+        pyarrow = get_pyarrow()
+        table = pyarrow.table(OrderedDict((name, column.to_arrow()) for name, column in self.columns.items()))
+        if format == 'parquet':
+            import pyarrow.parquet
+            pyarrow.parquet.write_table(table, path)
+        else:
+            with pyarrow.OSFile(path, 'wb') as sink:
+                with pyarrow.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+
+def get_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+    except ImportError:
+        raise ValueError('The parquet and arrow output formats need pyarrow; install it with "pip install pyarrow" or use the columns format')
+    return pyarrow
+
+def write_table(spool_path, output_path, output_format):
+    # read the rows written to the spool into a table and write it out
+    table = Table()
+    with open(spool_path, encoding='utf-8') as f:
+        for record in read_records(f, 'jsonl'):
+            table.append(record)
+    table.write(output_path, output_format)
+    os.remove(spool_path)
+    return table
+
+def run(function, input_path, output_path, auth_token, columns=None, properties='*',
+        input_format=None, output_format=None, max_concurrency=DEFAULT_CONCURRENCY,
+        chunk_size=DEFAULT_CHUNK_SIZE, checkpoint_path=None, log=None, org_properties='*', stats=None):
+
+    default_columns, property_map = FUNCTIONS[function]
+    columns = columns or default_columns
+    if len(columns) != len(default_columns):
+        raise ValueError('Expected %d input column(s) for %s' % (len(default_columns), function))
+
+    properties = get_properties(to_list(properties), property_map)
+    projection = get_projection(properties, property_map)
+    if function == 'enrich-people-org':
+        org_properties = get_properties(to_list(org_properties), COMPANY_PROPERTY_MAP)
+        org_projection = get_projection(org_properties, COMPANY_PROPERTY_MAP)
+        lookup = get_lookup(function, auth_token, projection, max_concurrency, len(properties), org_projection)
+        properties = properties + [ORG_COLUMN_PREFIX + p for p in org_properties]
+    else:
+        lookup = get_lookup(function, auth_token, projection, max_concurrency)
+
+    input_format = get_format(input_path, input_format)
+    output_format = get_format(output_path, output_format)
+    check_columns(input_path, input_format, columns)
+    checkpoint_path = checkpoint_path or output_path + '.checkpoint'
+
+    # columnar output is written as JSONL to a spool file until the run is
+    # complete; check pyarrow is there first rather than after the lookups
+    table_path, table_format = None, None
+    if output_format in COLUMNAR_FORMATS:
+        if output_format != 'columns':
+            get_pyarrow()
+        table_path, table_format = output_path, output_format
+        output_path, output_format = output_path + '.spool', 'jsonl'
+
+    # if there's a checkpoint, skip the rows that are done and remove any
+    # output written after the checkpoint was saved
+    done, offset = read_checkpoint(checkpoint_path)
+    if done > 0 and offset is not None and os.path.exists(output_path):
+        output = open(output_path, 'r+', newline='', encoding='utf-8')
+        output.truncate(offset)
+        output.seek(offset)
+    else:
+        done = 0
+        output = open(output_path, 'w', newline='', encoding='utf-8')
+
+    with open_input(input_path) as input, output:
+        records = itertools.islice(read_records(input, input_format), done, None)
+        writer = None
+        invalid, duplicates = 0, 0
+        while True:
+            chunk = list(itertools.islice(records, chunk_size))
+            if len(chunk) == 0:
+                break
+
+            # normalize the rows in the chunk in one pass, then look up each
+            # distinct row that has a valid value concurrently
+            rows = [get_values(record, columns) for record in chunk]
+            values = normalize_rows(rows, NORMALIZERS[function])
+            unique, indexes = dedupe_values(values)
+            invalid += sum(1 for row, value in zip(rows, values) if not any(value) and any(v.strip() for v in row))
+            duplicates += sum(1 for index in indexes if index >= 0) - len(unique)
+            result = list(expand_rows(lookup(unique), indexes))
+
+            # write the input rows with the properties added to them
+            if output_format == 'csv':
+                if writer is None:
+                    fieldnames = list(chunk[0].keys()) + get_output_columns(properties, chunk[0])
+                    writer = csv.DictWriter(output, fieldnames=fieldnames, extrasaction='ignore')
+                    if done == 0:
+                        writer.writeheader()
+            for record, row in zip(chunk, result):
+                names = get_output_columns(properties, record)
+                record = dict(record)
+                record.update(zip(names, row + ['']*(len(properties)-len(row))))
+                if output_format == 'csv':
+                    writer.writerow(record)
+                else:
+                    output.write(dumps(record) + '\n')
+
+            # save the progress
+            output.flush()
+            done += len(chunk)
+            write_checkpoint(checkpoint_path, done, output.tell())
+            if log is not None:
+                log('%d rows done' % done)
+
+    if log is not None:
+        log('%d lookups avoided: %d invalid, %d duplicate' % (invalid + duplicates, invalid, duplicates))
+    if stats is not None:
+        stats['invalid'] = stats.get('invalid', 0) + invalid
+        stats['duplicate'] = stats.get('duplicate', 0) + duplicates
+
+    if table_path is not None:
+        write_table(output_path, table_path, table_format)
+
+    # the run is complete, so there's nothing to resume
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    return done
+
+def get_shard(values, normalizers, shards):
+    # return the shard for a row; rows are sharded by their email or domain
+    # (or for find-person, the profile if there's no email), normalized the
+    # same way as the lookups, so the same person or organization always
+    # goes to the same worker and its cache
+    normalized = (normalize(value) for normalize, value in zip(normalizers, values))
+    key = next((value for value in normalized if value), '')
+    return zlib.crc32(key.encode('utf-8')) % shards
+
+def init_worker(shards, adaptive_concurrency=0):
+    # the workers each have their own rate limiter, so each one takes its
+    # share of the rate limit (both the starting rate and the rate the API's
+    # headers give) so together they stay within it; each worker also has
+    # its own adaptive concurrency limit (if it's on), and since each one
+    # backs off when the API pushes back, they settle on a share of it
+    import fullcontact_core
+    fullcontact_core.RATE_LIMIT_SHARE = 1.0 / shards
+    if adaptive_concurrency > 0:
+        fullcontact_core.enable_adaptive_concurrency(adaptive_concurrency)
+
+def run_shard(shard, function, input_path, output_path, auth_token, columns, properties,
+              max_concurrency, chunk_size, org_properties):
+    # enrich a shard in a worker process; the workers share the on-disk
+    # cache (if any) with each other and with the functions
+    stats = {}
+    done = run(function, input_path, output_path, auth_token, columns=columns, properties=properties,
+               input_format='jsonl', output_format='jsonl', max_concurrency=max_concurrency,
+               chunk_size=chunk_size, org_properties=org_properties, stats=stats)
+
+    # mark the shard as done so it's not run again if the merge is resumed;
+    # the lookups it avoided are kept with the mark so they're totaled for
+    # every shard, including the ones done before the run was resumed
+    with open(output_path + '.done', 'w') as f:
+        json.dump(stats, f)
+    return done
+
+def run_sharded(function, input_path, output_path, auth_token, workers, columns=None, properties='*',
+                input_format=None, output_format=None, max_concurrency=DEFAULT_CONCURRENCY,
+                chunk_size=DEFAULT_CHUNK_SIZE, log=None, org_properties='*'):
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    default_columns, property_map = FUNCTIONS[function]
+    columns = columns or default_columns
+    if len(columns) != len(default_columns):
+        raise ValueError('Expected %d input column(s) for %s' % (len(default_columns), function))
+
+    input_format = get_format(input_path, input_format)
+    output_format = get_format(output_path, output_format)
+    check_columns(input_path, input_format, columns)
+    if output_format in COLUMNAR_FORMATS and output_format != 'columns':
+        get_pyarrow()
+
+    # the shards are kept next to the output until the run is complete so
+    # an interrupted run can be resumed; each shard has its own checkpoint
+    shard_path = output_path + '.shards'
+    shard_inputs = [os.path.join(shard_path, 'input-%d.jsonl' % shard) for shard in range(workers)]
+    shard_outputs = [os.path.join(shard_path, 'output-%d.jsonl' % shard) for shard in range(workers)]
+    split_path = os.path.join(shard_path, 'split.json')
+
+    # split the input into the shards, unless that's already done
+    if os.path.exists(split_path):
+        with open(split_path) as f:
+            if json.load(f)['shards'] != workers:
+                raise ValueError('The run being resumed has a different number of workers; use --workers %d' % workers)
+    else:
+        os.makedirs(shard_path, exist_ok=True)
+        files = [open(path, 'w', encoding='utf-8') for path in shard_inputs]
+        try:
+            with open_input(input_path) as input:
+                for record in read_records(input, input_format):
+                    files[get_shard(get_values(record, columns), NORMALIZERS[function], workers)].write(dumps(record) + '\n')
+        finally:
+            for f in files:
+                f.close()
+        with open(split_path + '.tmp', 'w') as f:
+            json.dump({'shards': workers}, f)
+        os.replace(split_path + '.tmp', split_path)
+        if log is not None:
+            log('split input into %d shards' % workers)
+
+    # enrich the shards that aren't done in parallel
+    done = 0
+    limiter = get_concurrency_limiter()
+    adaptive_concurrency = limiter.max_limit if limiter is not None else 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(workers, adaptive_concurrency)) as executor:
+        futures = [
+            executor.submit(run_shard, shard, function, shard_inputs[shard], shard_outputs[shard], auth_token,
+                            columns, properties, max_concurrency, chunk_size, org_properties)
+            for shard in range(workers) if not os.path.exists(shard_outputs[shard] + '.done')
+        ]
+        for future in futures:
+            done += future.result()
+            if log is not None:
+                log('%d rows done' % done)
+
+    # total the lookups avoided by the shards
+    if log is not None:
+        invalid, duplicates = 0, 0
+        for path in shard_outputs:
+            with open(path + '.done') as f:
+                stats = json.loads(f.read() or '{}')
+            invalid += stats.get('invalid', 0)
+            duplicates += stats.get('duplicate', 0)
+        log('%d lookups avoided: %d invalid, %d duplicate' % (invalid + duplicates, invalid, duplicates))
+
+    # merge the shard outputs in the original row order; the rows in each
+    # shard are in their original order, so the shard of each input row
+    # says which shard output has its result next; columnar output is
+    # merged into a spool file and then written as a table, as in run()
+    merge_path, merge_format = output_path, output_format
+    if output_format in COLUMNAR_FORMATS:
+        merge_path, merge_format = output_path + '.spool', 'jsonl'
+    outputs = [open(path, encoding='utf-8') for path in shard_outputs]
+    try:
+        with open_input(input_path) as input, open(merge_path, 'w', newline='', encoding='utf-8') as output:
+            writer = None
+            rows = 0
+            for record in read_records(input, input_format):
+                line = outputs[get_shard(get_values(record, columns), NORMALIZERS[function], workers)].readline()
+                if merge_format == 'csv':
+                    record = json.loads(line)
+                    if writer is None:
+                        writer = csv.DictWriter(output, fieldnames=list(record.keys()), extrasaction='ignore')
+                        writer.writeheader()
+                    writer.writerow(record)
+                else:
+                    output.write(line)
+                rows += 1
+    finally:
+        for f in outputs:
+            f.close()
+    if merge_path != output_path:
+        write_table(merge_path, output_path, output_format)
+
+    # the run is complete, so there's nothing to resume
+    for path in shard_inputs + shard_outputs:
+        for name in (path, path + '.done', path + '.checkpoint'):
+            if os.path.exists(name):
+                os.remove(name)
+    os.remove(split_path)
+    os.rmdir(shard_path)
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description='Enrich a CSV or JSONL file with FullContact')
+    parser.add_argument('function', choices=sorted(FUNCTIONS.keys()), help='the function to run for each row')
+    parser.add_argument('input', help='the CSV or JSONL file to read')
+    parser.add_argument('output', help='the CSV or JSONL file to write')
+    parser.add_argument('--column', action='append', help='the input column(s) to look up (defaults to email, domain or email and profile)')
+    parser.add_argument('--properties', default='*', help='the properties to return (defaults to all properties)')
+    parser.add_argument('--org-properties', default='*', help='the organization properties to return for enrich-people-org (defaults to all properties)')
+    parser.add_argument('--input-format', choices=['csv', 'jsonl'], help='the input format (defaults to the file extension)')
+    parser.add_argument('--output-format', choices=['csv', 'jsonl'] + list(COLUMNAR_FORMATS), help='the output format (defaults to the file extension); columns, parquet and arrow write the results by column, with repeated values stored once')
+    parser.add_argument('--concurrency', type=int, help='the maximum number of lookups to run at the same time (defaults to %d, or the adaptive maximum)' % DEFAULT_CONCURRENCY)
+    parser.add_argument('--adaptive-concurrency', type=int, metavar='MAX', help='adjust the number of requests in flight to what the API can handle, up to the given maximum')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='the number of rows to look up between checkpoints')
+    parser.add_argument('--workers', type=int, default=1, help='the number of worker processes to split the input between')
+    parser.add_argument('--checkpoint', help='the checkpoint file (defaults to the output file with .checkpoint added)')
+    parser.add_argument('--api-key', default=os.environ.get('FULLCONTACT_API_KEY'), help='the FullContact api key')
+    args = parser.parse_args()
+
+    if args.api_key is None:
+        parser.error('an api key is required; use --api-key or set FULLCONTACT_API_KEY')
+    if get_format(args.output, args.output_format) in ('parquet', 'arrow'):
+        try:
+            get_pyarrow()
+        except ValueError as e:
+            parser.error(str(e))
+    try:
+        check_columns(args.input, get_format(args.input, args.input_format), args.column or FUNCTIONS[args.function][0])
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.adaptive_concurrency is not None:
+        if args.adaptive_concurrency < 1:
+            parser.error('the adaptive concurrency must be at least 1')
+        enable_adaptive_concurrency(args.adaptive_concurrency)
+
+    # with adaptive concurrency, run as many lookups at a time as the limit
+    # can grow to and let the limiter decide how many requests are in flight
+    limiter = get_concurrency_limiter()
+    if args.concurrency is None:
+        args.concurrency = limiter.max_limit if limiter is not None else DEFAULT_CONCURRENCY
+    if args.concurrency < 1 or args.chunk_size < 1 or args.workers < 1:
+        parser.error('the concurrency, chunk size and workers must be at least 1')
+
+    log = lambda message: print(message, file=sys.stderr)
+    if args.workers > 1:
+        run_sharded(args.function, args.input, args.output, args.api_key, args.workers, columns=args.column,
+                    properties=args.properties, input_format=args.input_format, output_format=args.output_format,
+                    max_concurrency=args.concurrency, chunk_size=args.chunk_size, log=log, org_properties=args.org_properties)
+        return
+    run(args.function, args.input, args.output, args.api_key, columns=args.column, properties=args.properties,
+        input_format=args.input_format, output_format=args.output_format, max_concurrency=args.concurrency,
+        chunk_size=args.chunk_size, checkpoint_path=args.checkpoint, log=log, org_properties=args.org_properties)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,2008 @@
+# shared code for the FullContact functions; each function file validates
+# its input and then delegates to the functions here, so the settings,
+# validators and property maps are only set up once per worker process;
+# the heavier modules (requests, sqlite3) are imported
+# the first time they're needed rather than when a function is loaded
+
+import os
+import re
+import json
+import time
+import random
+import hashlib
+import threading
+import operator
+import itertools
+import contextvars
+from decimal import Decimal
+from datetime import date, datetime
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError, FIRST_COMPLETED, wait
+
+# maximum number of compiled projections of the requested properties to keep
+MAX_PROJECTIONS = 1000
+
+_projections = {}
+
+# maximum number of lookups to run at the same time when enriching a range
+# of values; can be overridden with the 'fullcontact_concurrency' variable
+DEFAULT_CONCURRENCY = 8
+
+# adaptive concurrency settings; with a maximum (which turns it on), the
+# number of requests in flight in this worker process is limited by an
+# AIMD controller instead of only by each call's concurrency: the limit
+# starts at the default concurrency, grows by one for each limit's worth of
+# healthy responses and is cut in half on a 429, a server error or a
+# timeout, or cut back a little when the latency rises too far above the
+# lowest seen (the tolerance is the ratio allowed); the concurrency of a
+# call then defaults to the maximum so the limiter decides; it can also be
+# turned on with enable_adaptive_concurrency()
+ADAPTIVE_CONCURRENCY = int(os.environ.get('FULLCONTACT_ADAPTIVE_CONCURRENCY', 0))
+ADAPTIVE_MIN_CONCURRENCY = int(os.environ.get('FULLCONTACT_ADAPTIVE_MIN_CONCURRENCY', 1))
+ADAPTIVE_LATENCY_TOLERANCE = float(os.environ.get('FULLCONTACT_ADAPTIVE_LATENCY_TOLERANCE', 2))
+ADAPTIVE_BACKOFF = 0.5
+ADAPTIVE_LATENCY_BACKOFF = 0.9
+
+_concurrency_limiter = None
+
+# number of rows of a range to look up and write to the output at a time;
+# each chunk is serialized and written as soon as it's done, so the whole
+# result is never held in memory as a single string
+OUTPUT_CHUNK_SIZE = int(os.environ.get('FULLCONTACT_OUTPUT_CHUNK_SIZE', 1000))
+
+# orjson is used to serialize the output and decode responses when it's
+# installed; None until it's first needed, then the module or False if it's
+# not installed
+_orjson = None
+
+# base url of the FullContact API; can be pointed at a local server for testing
+API_URL = os.environ.get('FULLCONTACT_API_URL', 'https://api.fullcontact.com/v3')
+
+# rate limit settings for the token bucket shared by every call in this
+# worker process; the rate (requests per second) starts at the given value
+# and is then adjusted from the rate limit headers the API returns; 429
+# responses are retried through the rate limiter up to the given number of times
+RATE_LIMIT = float(os.environ.get('FULLCONTACT_RATE_LIMIT', 10))
+RATE_LIMIT_BURST = int(os.environ.get('FULLCONTACT_RATE_LIMIT_BURST', 10))
+RATE_LIMIT_RETRIES = int(os.environ.get('FULLCONTACT_RATE_LIMIT_RETRIES', 3))
+MIN_RATE_LIMIT = 0.1
+
+# the share of the account's rate limit this worker process uses; when the
+# limit is split between processes (e.g. the bulk runner's workers), each
+# one takes its share of both the starting rate and the rate from the headers
+RATE_LIMIT_SHARE = 1.0
+
+# request timeouts and retries; each request times out if it can't connect
+# or doesn't get a response within the given number of seconds, and server
+# errors (5xx) and connection errors are tried again with exponential backoff
+# up to the given number of times
+CONNECT_TIMEOUT = float(os.environ.get('FULLCONTACT_CONNECT_TIMEOUT', 3.05))
+READ_TIMEOUT = float(os.environ.get('FULLCONTACT_READ_TIMEOUT', 10))
+SERVER_RETRIES = int(os.environ.get('FULLCONTACT_SERVER_RETRIES', 3))
+SERVER_RETRY_BACKOFF = 0.3
+SERVER_RETRY_STATUSES = (500, 502, 503, 504)
+
+# circuit breaker settings; after the given number of server errors (5xx)
+# or connection errors in a row, the circuit opens and requests fail right
+# away (or return the stale cached result, if there is one) instead of
+# waiting for timeouts and retries; after the reset time, one request is let
+# through to probe the API, and the circuit closes again if it succeeds (or
+# stays open for another reset time if it fails); 0 failures turns this off
+CIRCUIT_FAILURES = int(os.environ.get('FULLCONTACT_CIRCUIT_FAILURES', 5))
+CIRCUIT_RESET_TIMEOUT = float(os.environ.get('FULLCONTACT_CIRCUIT_RESET_TIMEOUT', 30))
+
+_circuit_breaker = None
+_circuit_breaker_lock = threading.Lock()
+
+# number of seconds each call has to finish its lookups in, including the
+# waits for the rate limiter and retries; lookups that can't finish in time
+# return the timed out row (the rows that finished are still returned); can
+# be overridden with the 'fullcontact_time_budget' variable, and 0 means no
+# limit (each request still has its own timeouts)
+TIME_BUDGET = float(os.environ.get('FULLCONTACT_TIME_BUDGET', 25))
+TIMED_OUT_ROW = ['Timed Out']
+PENDING_ROW = ['Result Pending...']
+
+# the row returned for a lookup that fails (e.g. a server error that's still
+# failing after the retries, or the circuit is open) so the rest of the rows
+# are still returned; a call with a single value raises the error instead so
+# its message is shown, as the functions always have
+ERROR_ROW = ['Error']
+
+# the deadline for the current call, as a time.monotonic() value; it's a
+# context variable so it follows the call onto the threads it runs lookups on
+_deadline = contextvars.ContextVar('fullcontact_deadline', default=None)
+
+# whether a failed lookup raises its error rather than returning the error row
+_raise_errors = contextvars.ContextVar('fullcontact_raise_errors', default=False)
+
+# the pool of threads the lookups run on; it's shared by every call in this
+# worker process and grows to the largest concurrency a call has asked for
+_executor = None
+_executor_workers = 0
+_executor_lock = threading.Lock()
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+# connection pool settings for the session shared by every call in this
+# worker process; the number of hosts to keep pools for and the number of
+# keep-alive connections to keep in each pool
+POOL_CONNECTIONS = int(os.environ.get('FULLCONTACT_POOL_CONNECTIONS', 10))
+POOL_MAXSIZE = int(os.environ.get('FULLCONTACT_POOL_MAXSIZE', 10))
+
+_session = None
+_session_lock = threading.Lock()
+
+# response cache settings; results are kept in memory for the worker process
+# and, if a cache path is given, in a sqlite database on disk that's shared
+# by every worker process on the host; results are kept for a number of
+# seconds that depends on the endpoint, and results that can't be found are
+# kept for a shorter time; the timeout is how long to wait for another
+# process that's writing to the database before giving up on the write
+CACHE_SIZE = int(os.environ.get('FULLCONTACT_CACHE_SIZE', 10000))
+CACHE_DISK_SIZE = int(os.environ.get('FULLCONTACT_CACHE_DISK_SIZE', 1000000))
+CACHE_PATH = os.environ.get('FULLCONTACT_CACHE_PATH')
+CACHE_TIMEOUT = float(os.environ.get('FULLCONTACT_CACHE_TIMEOUT', 1))
+
+# number of times to try setting up the cache database before the cache
+# falls back to memory only (e.g. when it's locked by the other processes
+# that are setting it up at the same time)
+CACHE_OPEN_ATTEMPTS = 5
+CACHE_TTL = {
+    'person.enrich': int(os.environ.get('FULLCONTACT_PERSON_CACHE_TTL', 7*24*60*60)),
+    'company.enrich': int(os.environ.get('FULLCONTACT_COMPANY_CACHE_TTL', 30*24*60*60))
+}
+CACHE_NEGATIVE_TTL = int(os.environ.get('FULLCONTACT_NEGATIVE_CACHE_TTL', 24*60*60))
+
+# number of seconds results are kept after they expire so they can still be
+# returned while the API is down (see the circuit breaker settings)
+CACHE_STALE_TTL = int(os.environ.get('FULLCONTACT_STALE_CACHE_TTL', 7*24*60*60))
+
+_cache = None
+_cache_lock = threading.Lock()
+
+_single_flight = None
+_single_flight_lock = threading.Lock()
+
+# maximum number of identifiers (emails and social profile usernames) to keep
+# in the index of person results; a lookup by any identifier in the index is
+# answered from the index rather than by calling the API
+IDENTITY_INDEX_SIZE = int(os.environ.get('FULLCONTACT_IDENTITY_INDEX_SIZE', 100000))
+
+_identities = None
+_identities_lock = threading.Lock()
+
+# incremental refresh settings; with a maximum age (in seconds, which can be
+# overridden with the 'fullcontact_max_age' variable), the row returned for
+# each input is stored with a fingerprint of the requested properties and
+# the time it was fetched; a refresh then only looks up the rows that are
+# new, were edited, are older than the maximum age or were blank, pending or
+# timed out, and returns every other row from the stored rows; the rows are
+# stored with the response cache (so they're shared by the worker processes
+# if there's a cache path) and a maximum age of 0 turns this off
+REFRESH_MAX_AGE = float(os.environ.get('FULLCONTACT_REFRESH_MAX_AGE', 0))
+REFRESH_SIZE = int(os.environ.get('FULLCONTACT_REFRESH_SIZE', 100000))
+REFRESH_TTL = int(os.environ.get('FULLCONTACT_REFRESH_TTL', 30*24*60*60))
+
+_refresh_store = None
+_refresh_store_lock = threading.Lock()
+
+# whether the lookups for the current call should skip the response cache
+# and identity index and fetch the results again; it's a context variable
+# (like the deadline) so it follows the call onto its lookup threads
+_refetch = contextvars.ContextVar('fullcontact_refetch', default=False)
+
+# patterns for checking the emails, domains and linkedin usernames before
+# they're looked up, after they've been normalized; values that can't be
+# valid are returned as blanks without calling the API (which would bill the
+# request and return a 400 or 422); the patterns are deliberately loose so
+# nothing that could be valid is skipped
+DOMAIN_PATTERN = r'(?:[a-z0-9_](?:[a-z0-9_-]{0,61}[a-z0-9])?\.)+(?:[a-z]{2,63}|xn--[a-z0-9-]{1,59})'
+EMAIL_PATTERN = re.compile(r'[^@\s<>()\[\],;:"]+@' + DOMAIN_PATTERN)
+DOMAIN_NAME_PATTERN = re.compile(DOMAIN_PATTERN)
+PROFILE_PATTERN = re.compile(r'[^\s/?#@]+')
+URL_SCHEME_PATTERN = re.compile(r'[a-z][a-z0-9+.-]*://')
+URL_PATH_PATTERN = re.compile(r'[/?#]')
+
+# settings for polling results that are pending (202) in the background;
+# the first poll is after the given delay (in seconds), the delay doubles
+# after each poll that's still pending, and polling stops after the given
+# number of polls; completed results are stored in the response cache
+PENDING_POLL_DELAY = float(os.environ.get('FULLCONTACT_PENDING_POLL_DELAY', 5))
+PENDING_POLL_ATTEMPTS = int(os.environ.get('FULLCONTACT_PENDING_POLL_ATTEMPTS', 6))
+
+_poller = None
+_poller_lock = threading.Lock()
+
+# instrumentation of where the time goes in each call (parsing, validation,
+# rate limiting, the network round trip and serialization), along with
+# counts of retries, response status codes and cache hits; it's off unless
+# enable_metrics() is called or a file is given for the metrics to be
+# written to (in the Prometheus text format) after each call, and when it's
+# off, the only cost is checking whether it's on
+METRICS_PATH = os.environ.get('FULLCONTACT_METRICS_PATH')
+
+_metrics = None
+
+# map the functions' property names to the API's property names
+PERSON_PROPERTY_MAP = OrderedDict()
+PERSON_PROPERTY_MAP['full_name'] = 'fullName'
+PERSON_PROPERTY_MAP['age_range'] = 'ageRange'
+PERSON_PROPERTY_MAP['gender'] = 'gender'
+PERSON_PROPERTY_MAP['location'] = 'location'
+PERSON_PROPERTY_MAP['title'] = 'title'
+PERSON_PROPERTY_MAP['organization'] = 'organization'
+PERSON_PROPERTY_MAP['twitter_url'] = 'twitter'
+PERSON_PROPERTY_MAP['facebook_url'] = 'facebook'
+PERSON_PROPERTY_MAP['linkedin_url'] = 'linkedin'
+PERSON_PROPERTY_MAP['bio'] = 'bio'
+PERSON_PROPERTY_MAP['avatar_url'] = 'avatar'
+
+COMPANY_PROPERTY_MAP = OrderedDict()
+COMPANY_PROPERTY_MAP['name'] = 'name'
+COMPANY_PROPERTY_MAP['location'] = 'location'
+COMPANY_PROPERTY_MAP['twitter_url'] = 'twitter'
+COMPANY_PROPERTY_MAP['linkedin_url'] = 'linkedin'
+COMPANY_PROPERTY_MAP['bio'] = 'bio'
+COMPANY_PROPERTY_MAP['logo'] = 'logo'
+COMPANY_PROPERTY_MAP['website'] = 'website'
+COMPANY_PROPERTY_MAP['founded'] = 'founded'
+COMPANY_PROPERTY_MAP['employees'] = 'employees'
+COMPANY_PROPERTY_MAP['locale'] = 'locale'
+COMPANY_PROPERTY_MAP['category'] = 'category'
+
+def get_auth_token(flex):
+    # get the api key from the variable input
+    auth_token = dict(flex.vars).get('fullcontact_api_key')
+    if auth_token is None:
+        raise ValueError
+    return auth_token
+
+class InputValidator:
+    # maps a function's positional input to its parameter names, then
+    # coerces and validates each value; the parameters use the same rules as
+    # a cerberus schema, but only the rules the functions need ('required',
+    # 'type': 'string', 'coerce', 'validator' (or 'check_with') and 'default')
+    # are supported, and they're compiled once so each call only runs the
+    # checks themselves
+
+    RULES = ('required', 'type', 'coerce', 'validator', 'check_with', 'default')
+
+    def __init__(self, params):
+        self.params = params
+        self.fields = []
+        for name, rules in params.items():
+            if any(rule not in self.RULES for rule in rules) or rules.get('type', 'string') != 'string':
+                raise ValueError('Unsupported rule for parameter: ' + name)
+            self.fields.append((
+                name,
+                rules.get('required', False),
+                'default' in rules,
+                rules.get('default'),
+                rules.get('coerce'),
+                rules.get('type') == 'string',
+                rules.get('validator', rules.get('check_with'))
+            ))
+
+    def read(self, flex):
+        metrics = _metrics
+        if metrics is not None:
+            start = time.perf_counter()
+
+        # get the input
+        input = flex.input.read()
+        try:
+            input = json.loads(input)
+            if not isinstance(input, list): raise ValueError
+        except ValueError:
+            raise ValueError
+
+        if metrics is not None:
+            parsed = time.perf_counter()
+            metrics.time('parse', parsed - start)
+
+        # validate the input; if the input isn't valid, return an error
+        input = self.validated(input)
+        if input is None:
+            raise ValueError
+
+        if metrics is not None:
+            metrics.time('validate', time.perf_counter() - parsed)
+        return input
+
+    def validated(self, values):
+        # return the positional values mapped to the parameter names, or
+        # None if the values aren't valid; values past the last parameter
+        # are ignored
+        document = {}
+        count = len(values)
+        for index, (name, required, has_default, default, coerce, is_string, validator) in enumerate(self.fields):
+            # missing and null values are replaced with the default
+            value = values[index] if index < count else None
+            if value is None and has_default:
+                value = default
+            elif index >= count:
+                if required:
+                    return None
+                continue
+
+            if coerce is not None:
+                try:
+                    value = coerce(value)
+                except Exception:
+                    return None
+
+            # null values aren't allowed
+            if value is None:
+                return None
+            if is_string and not isinstance(value, str):
+                return None
+            if validator is not None:
+                errors = []
+                validator(name, value, lambda field, message: errors.append(message))
+                if len(errors) > 0:
+                    return None
+
+            document[name] = value
+        return document
+
+    def validated_rows(self, rows):
+        # validate a batch of rows of positional values in one pass; returns
+        # a list with the mapped values (or None if invalid) for each row
+        validated = self.validated
+        return [validated(row) if isinstance(row, list) else None for row in rows]
+
+def get_properties(properties, property_map):
+    # get the properties to return; property names aren't case-sensitive,
+    # but the dotted paths to nested fields keep their case since the
+    # fields of the response are camelCase (e.g. 'details.keyPeople')
+    properties = [p.strip() for p in properties]
+    properties = [p if '.' in p and p.lower() not in property_map else p.lower() for p in properties]
+
+    # if we have a wildcard, get all the properties
+    if len(properties) == 1 and properties[0] == '*':
+        properties = list(property_map.keys())
+    return properties
+
+def get_projection(properties, property_map):
+    # return a function that limits a response to the requested properties;
+    # the function is compiled once for each list of properties and reused
+    # for every response in a batch and every later call
+    key = (id(property_map), ','.join(properties))
+    projection = _projections.get(key)
+    if projection is None:
+        if len(_projections) >= MAX_PROJECTIONS:
+            _projections.clear()
+        projection = _projections[key] = compile_projection(properties, property_map)
+    return projection
+
+def compile_projection(properties, property_map):
+    # map each property to its path in the response; properties that aren't
+    # in the property map can be given as a dotted path to a nested field of
+    # the response (e.g. 'details.employment'); any other properties return
+    # a blank
+    paths = []
+    for p in properties:
+        path = property_map.get(p)
+        if path is None:
+            path = p if '.' in p else ''
+        paths.append(tuple(path.split('.')))
+
+    # if all the properties are top-level fields, get them all at once;
+    # otherwise, follow the path for each property
+    if all(len(path) == 1 for path in paths):
+        keys = [path[0] for path in paths]
+        getter = operator.itemgetter(*keys)
+        def project(content):
+            try:
+                values = getter(content)
+                if len(keys) == 1:
+                    values = (values,)
+            except KeyError:
+                values = map(content.get, keys)
+            return [to_cell(value) for value in values]
+    else:
+        def project(content):
+            return [to_cell(get_path(content, path)) for path in paths]
+
+    # the top-level fields the properties come from, so the rest of each
+    # response can be skipped when it's decoded
+    project.keys = frozenset(path[0] for path in paths if len(path[0]) > 0)
+    return project
+
+def get_path(content, path):
+    # return the value at the path in the response, or None if the path
+    # isn't in the response
+    for key in path:
+        if not isinstance(content, dict):
+            return None
+        content = content.get(key)
+    return content
+
+def to_cell(value):
+    # blank out missing values and return nested values (e.g. a list of
+    # employment details) as a JSON string so they fit in a single cell
+    if not value:
+        return ''
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=to_string)
+    return value
+
+def write_rows(flex, result, width):
+    # write the rows as a json array a chunk at a time; the result may be
+    # a list or an iterator of rows (e.g. from iter_lookups), in which case
+    # each chunk is written as soon as its lookups are done
+    rows = iter(result)
+
+    # if we're returning more than one row, pad the pending/blank rows
+    # to the width of the other rows so the output is rectangular
+    first = list(itertools.islice(rows, 2))
+    pad = len(first) > 1
+    rows = itertools.chain(first, rows)
+
+    metrics = _metrics
+    elapsed = 0.0
+    count = 0
+
+    # return the results
+    flex.output.content_type = "application/json"
+    flex.output.write('[')
+    while True:
+        chunk = list(itertools.islice(rows, OUTPUT_CHUNK_SIZE))
+        if len(chunk) == 0:
+            break
+        start = time.perf_counter()
+        if pad:
+            chunk = [row + ['']*(width-len(row)) for row in chunk]
+        data = dumps(chunk)[1:-1]
+        flex.output.write(data if count == 0 else ',' + data)
+        elapsed += time.perf_counter() - start
+        count += len(chunk)
+    flex.output.write(']')
+
+    # the call is done, so pass the metrics to the hook
+    if metrics is not None:
+        metrics.count('calls')
+        metrics.count('rows', count)
+        metrics.time('serialize', elapsed)
+        metrics.emit()
+
+def get_orjson():
+    # return the orjson module, or False if it's not installed
+    global _orjson
+    if _orjson is None:
+        try:
+            import orjson
+            _orjson = orjson
+        except ImportError:
+            _orjson = False
+    return _orjson
+
+def dumps(value):
+    # serialize the value as compact json with orjson if it's installed and
+    # json otherwise; dates and decimals are converted by to_string with
+    # either one (orjson would otherwise format dates itself)
+    orjson = get_orjson()
+    if orjson:
+        try:
+            return orjson.dumps(value, default=to_string, option=orjson.OPT_PASSTHROUGH_DATETIME).decode('utf-8')
+        except TypeError:
+            # orjson doesn't handle everything json does (e.g. integers
+            # larger than 64 bits), so fall back to json
+            pass
+    return json.dumps(value, default=to_string, separators=(',', ':'), ensure_ascii=False)
+
+def parse_content(content, keys=None):
+    # decode a response body; responses are cached as their json text,
+    # which takes a fraction of the memory of the decoded content, and are
+    # only decoded when they're used; if keys are given, only those
+    # top-level fields are kept so the rest of the response (e.g. the large
+    # details block) is freed straight away
+    if not isinstance(content, (str, bytes)):
+        return content
+
+    metrics = _metrics
+    if metrics is not None:
+        start = time.perf_counter()
+    orjson = get_orjson()
+    content = orjson.loads(content) if orjson else json.loads(content)
+    if keys is not None and isinstance(content, dict):
+        content = {key: content[key] for key in keys if key in content}
+    if metrics is not None:
+        metrics.time('decode', time.perf_counter() - start)
+    return content
+
+def enrich_person(auth_token, email, projection):
+
+    # if we don't have an email, return a blank without calling the API
+    email = email.lower().strip()
+    if len(email) == 0:
+        return ['']
+
+    # if we've already seen a person with this email, return them
+    headers = get_headers(auth_token)
+    identifiers = ['email:' + email]
+    content = find_identity(headers, identifiers)
+    if content is not None:
+        return get_row(200, content, projection)
+
+    # see here for more info:
+    # https://docs.fullcontact.com/#person-enrichment
+    # https://dashboard.fullcontact.com/api-ref#response-codes-&-errors
+
+    data = json.dumps({
+        'email': email
+    })
+    url = API_URL + '/person.enrich'
+
+    status_code, content = post_cached(url, data, headers, CACHE_TTL['person.enrich'])
+    if status_code == 200:
+        index_identity(headers, identifiers, content)
+    return get_row(status_code, content, projection)
+
+def enrich_org(auth_token, domain, projection):
+
+    # if we don't have a domain, return a blank without calling the API
+    domain = domain.lower().strip()
+    if len(domain) == 0:
+        return ['']
+
+    # see here for more info:
+    # https://docs.fullcontact.com/#company-enrichment
+    # https://dashboard.fullcontact.com/api-ref#response-codes-&-errors
+
+    data = json.dumps({
+        'domain': domain
+    })
+    url = API_URL + '/company.enrich'
+
+    status_code, content = post_cached(url, data, get_headers(auth_token), CACHE_TTL['company.enrich'])
+    return get_row(status_code, content, projection)
+
+def enrich_people_orgs(auth_token, emails, person_projection, person_width, org_projection, max_concurrency):
+    # enrich each person and the organization at their email domain; each
+    # distinct email and domain is only looked up once, and the organization
+    # is joined onto the row of every person at that domain
+    unique_emails = list(OrderedDict.fromkeys(email for email in emails if len(email) > 0))
+    domains = [get_domain(email) for email in emails]
+    unique_domains = list(OrderedDict.fromkeys(domain for domain in domains if len(domain) > 0))
+    if _metrics is not None:
+        _metrics.count('duplicate_lookups_avoided', sum(1 for email in emails if len(email) > 0) - len(unique_emails))
+        _metrics.count('org_lookups_avoided', sum(1 for domain in domains if len(domain) > 0) - len(unique_domains))
+
+    # look up the people and the organizations together so they share the
+    # concurrency limit
+    lookups = [(enrich_person, email, person_projection) for email in unique_emails]
+    lookups += [(enrich_org, domain, org_projection) for domain in unique_domains]
+    lookup = lambda value: value[0](auth_token, value[1], value[2])
+    result = run_lookups(lookup, lookups, max_concurrency)
+
+    # pad the pending/blank people to their width so the organization
+    # columns line up
+    people = dict(zip(unique_emails, result[:len(unique_emails)]))
+    orgs = dict(zip(unique_domains, result[len(unique_emails):]))
+    rows = []
+    for email, domain in zip(emails, domains):
+        person = people.get(email, [''])
+        rows.append(person + ['']*(person_width-len(person)) + orgs.get(domain, ['']))
+    return rows
+
+def get_domain(email):
+    # return the domain of an email address, or a blank if it doesn't have one
+    email = email.lower().strip()
+    if '@' not in email:
+        return ''
+    return email.rpartition('@')[2]
+
+def find_person(auth_token, email, profile, projection):
+    return find_people(auth_token, [(email, profile)], projection, 1)[0]
+
+def find_people(auth_token, values, projection, max_concurrency):
+    # find the person for each pair of email and linkedin username; people
+    # we've already seen with any of the identifiers are returned from the
+    # identity index, and rows that share an identifier are merged into a
+    # single lookup, so each person is only looked up once
+    headers = get_headers(auth_token)
+    result = [None]*len(values)
+    pending = []
+    for index, (email, profile) in enumerate(values):
+        identifiers = get_identifiers(email.lower().strip(), profile.lower().strip())
+        if len(identifiers) == 0:
+            result[index] = ['']
+            continue
+        content = find_identity(headers, identifiers)
+        if content is not None:
+            result[index] = get_row(200, content, projection)
+            continue
+        pending.append((index, identifiers))
+
+    groups = merge_identifiers(pending)
+    if _metrics is not None:
+        _metrics.count('duplicate_lookups_avoided', len(pending) - len(groups))
+    lookup = lambda group: get_row(*find_identifiers(headers, group[1]), projection=projection)
+    rows = run_lookups(lookup, groups, max_concurrency) if len(groups) > 0 else []
+    for (indexes, identifiers), row in zip(groups, rows):
+        for index in indexes:
+            result[index] = row
+    return result
+
+def find_identifiers(headers, identifiers):
+
+    # see here for more info:
+    # https://docs.fullcontact.com/#person-enrichment
+    # https://docs.fullcontact.com/#multi-field-request
+    # https://dashboard.fullcontact.com/api-ref#response-codes-&-errors
+
+    data = {}
+    emails = sorted(identifier[6:] for identifier in identifiers if identifier.startswith('email:'))
+    profiles = sorted(identifier.split(':', 1) for identifier in identifiers if not identifier.startswith('email:'))
+    if len(emails) > 0:
+        data['emails'] = emails
+    if len(profiles) > 0:
+        data['profiles'] = [
+            {
+                "service": service,
+                "username": username
+            }
+            for service, username in profiles
+        ]
+    data = json.dumps(data)
+    url = API_URL + '/person.enrich'
+
+    status_code, content = post_cached(url, data, headers, CACHE_TTL['person.enrich'])
+    if status_code == 200:
+        index_identity(headers, identifiers, content)
+    return status_code, content
+
+def get_identifiers(email, profile):
+    identifiers = []
+    if len(email) > 0:
+        identifiers.append('email:' + email)
+    if len(profile) > 0:
+        identifiers.append('linkedin:' + profile)
+    return identifiers
+
+def merge_identifiers(rows):
+    # group the rows that share any identifier (directly or through other
+    # rows); returns the row indexes and the identifiers for each group
+    parent = {}
+    def find(identifier):
+        while parent[identifier] != identifier:
+            parent[identifier] = parent[parent[identifier]]
+            identifier = parent[identifier]
+        return identifier
+
+    for index, identifiers in rows:
+        for identifier in identifiers:
+            parent.setdefault(identifier, identifier)
+        for identifier in identifiers[1:]:
+            root, other = find(identifiers[0]), find(identifier)
+            if root != other:
+                parent[other] = root
+
+    groups = OrderedDict()
+    for index, identifiers in rows:
+        group = groups.setdefault(find(identifiers[0]), ([], OrderedDict()))
+        group[0].append(index)
+        for identifier in identifiers:
+            group[1][identifier] = True
+    return [(indexes, list(identifiers.keys())) for indexes, identifiers in groups.values()]
+
+def get_identity_index():
+    # create the shared identity index on first use; it's an in-memory
+    # response cache keyed by identifier
+    global _identities
+    if _identities is None:
+        with _identities_lock:
+            if _identities is None:
+                _identities = ResponseCache(IDENTITY_INDEX_SIZE)
+    return _identities
+
+def find_identity(headers, identifiers):
+    # return the indexed person result for the first of the identifiers
+    # that's in the index, or None if none of them are (or the result is
+    # being fetched again)
+    if _refetch.get():
+        return None
+    index = get_identity_index()
+    auth = auth_hash(headers)
+    for identifier in identifiers:
+        content = index.get(auth + ' ' + identifier)
+        if content is not None:
+            if _metrics is not None:
+                _metrics.count('identity_hits')
+            return content
+    return None
+
+def index_identity(headers, identifiers, content):
+    # index the person result under the identifiers it was looked up with
+    # and the emails and social profiles in the result; if the result is
+    # already indexed (e.g. it came from the cache), there's nothing to do
+    index = get_identity_index()
+    auth = auth_hash(headers)
+    if all(index.get(auth + ' ' + identifier) is content for identifier in identifiers):
+        return
+    content_identifiers = get_profile_identifiers(parse_content(content, PROFILE_IDENTIFIER_KEYS))
+    for identifier in set(identifiers) | set(content_identifiers):
+        index.set(auth + ' ' + identifier, content, CACHE_TTL['person.enrich'])
+
+# the top-level fields of a person result the identifiers are taken from
+PROFILE_IDENTIFIER_KEYS = frozenset(['details', 'twitter', 'linkedin', 'facebook'])
+
+def get_profile_identifiers(content):
+    identifiers = []
+    details = content.get('details') or {}
+    for email in details.get('emails') or []:
+        if isinstance(email, dict) and email.get('value'):
+            identifiers.append('email:' + email['value'].lower().strip())
+    profiles = details.get('profiles') or {}
+    if isinstance(profiles, dict):
+        for service, profile in profiles.items():
+            if isinstance(profile, dict) and profile.get('username'):
+                identifiers.append(service.lower() + ':' + profile['username'].lower().strip())
+    for service in ('twitter', 'linkedin', 'facebook'):
+        url = content.get(service)
+        if isinstance(url, str) and len(url) > 0:
+            identifiers.append(service + ':' + url.rstrip('/').rsplit('/', 1)[-1].lower())
+    return identifiers
+
+def get_headers(auth_token):
+    return {
+        'Content-Type': 'application/json',
+        'Authorization': 'Bearer ' + auth_token
+    }
+
+def get_row(status_code, content, projection):
+
+    # sometimes results are pending; for these, return text indicating
+    # the result is pending so the user can refresh later to look for
+    # the completed result (which is polled for in the background)
+    if status_code == 202:
+        return PENDING_ROW
+
+    # if a result can't be found or wasn't formatted properly,
+    # return a blank (equivalent to not finding a bad email address)
+    if status_code == 400 or status_code == 404 or status_code == 422:
+        return ['']
+
+    # decode the fields of the result the properties come from and limit
+    # the result to the requested properties
+    return projection(parse_content(content, projection.keys))
+
+def get_concurrency(flex):
+    # get the maximum number of lookups to run at the same time; with
+    # adaptive concurrency, the default is the limiter's maximum
+    default = DEFAULT_CONCURRENCY if _concurrency_limiter is None else _concurrency_limiter.max_limit
+    try:
+        max_concurrency = int(dict(flex.vars).get('fullcontact_concurrency', default))
+        if max_concurrency < 1: raise ValueError
+    except (TypeError, ValueError):
+        raise ValueError
+    return max_concurrency
+
+def get_time_budget(flex):
+    # get the number of seconds the call has to finish its lookups in
+    try:
+        time_budget = float(dict(flex.vars).get('fullcontact_time_budget', TIME_BUDGET))
+        if time_budget < 0: raise ValueError
+    except (TypeError, ValueError):
+        raise ValueError
+    return time_budget
+
+def set_deadline(time_budget):
+    # start the time budget for the lookups made by this call; no time
+    # budget (None or 0) means no deadline
+    _deadline.set(time.monotonic() + time_budget if time_budget else None)
+
+def get_timeout(deadline):
+    # return the connect and read timeouts for a request, cut down to the
+    # time left before the deadline
+    if deadline is None:
+        return (CONNECT_TIMEOUT, READ_TIMEOUT)
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise DeadlineExceeded()
+    return (min(CONNECT_TIMEOUT, remaining), min(READ_TIMEOUT, remaining))
+
+class DeadlineExceeded(TimeoutError):
+    # raised when a lookup can't be finished before the call's deadline
+    pass
+
+def set_raise_errors(raise_errors):
+    # whether a failed lookup in this call raises its error (e.g. for a
+    # single value) or returns the error row (e.g. for a range of values)
+    _raise_errors.set(raise_errors)
+
+def run_lookups(lookup, values, max_concurrency, timed_out=TIMED_OUT_ROW, failed=ERROR_ROW):
+    # run the lookup for each of the values and return the results in the
+    # same order as the values; used by both single values and ranges;
+    # lookups that run out of time return the timed out value instead, and
+    # lookups that fail return the failed value; each lookup is a blocking
+    # call through the shared session, so they're run on the shared thread
+    # pool, with at most max_concurrency of them in flight at a time; each
+    # lookup runs in a copy of the call's context so it sees the call's
+    # deadline; a single value is looked up on the calling thread
+    if len(values) == 1:
+        return [get_lookup_result(lookup, values[0], timed_out, failed)]
+    executor = get_executor(max_concurrency)
+    context = contextvars.copy_context()
+    result = [None]*len(values)
+    items = enumerate(values)
+    running = {}
+    for index, value in itertools.islice(items, max_concurrency):
+        running[executor.submit(context.copy().run, get_lookup_result, lookup, value, timed_out, failed)] = index
+    while len(running) > 0:
+        done, not_done = wait(running, return_when=FIRST_COMPLETED)
+        for future in done:
+            result[running.pop(future)] = future.result()
+            for index, value in itertools.islice(items, 1):
+                running[executor.submit(context.copy().run, get_lookup_result, lookup, value, timed_out, failed)] = index
+    return result
+
+def get_lookup_result(lookup, value, timed_out, failed):
+    # run a lookup, returning the timed out value if it runs out of time and
+    # the failed value if it fails, so one lookup doesn't lose the rest of
+    # the batch (unless the call raises its errors)
+    try:
+        return lookup(value)
+    except DeadlineExceeded:
+        if _metrics is not None:
+            _metrics.count('timed_out')
+        return timed_out
+    except Exception:
+        if _raise_errors.get():
+            raise
+        if _metrics is not None:
+            _metrics.count('failed')
+        return failed
+
+def get_executor(max_workers):
+    # create the shared thread pool on first use, and replace it with a
+    # larger one if a call needs more threads than it has; the old pool
+    # isn't shut down since a call may still be submitting lookups to it,
+    # and its threads exit once it's no longer used
+    global _executor, _executor_workers
+    if _executor_workers < max_workers:
+        with _executor_lock:
+            if _executor_workers < max_workers:
+                from concurrent.futures import ThreadPoolExecutor
+                _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='fullcontact-lookup')
+                _executor_workers = max_workers
+    return _executor
+
+def normalize_email(value):
+    # return the canonical form of an email (lowercase, without whitespace,
+    # a mailto: prefix or a display name), a blank if there isn't one, or
+    # None if it can't be a valid email
+    email = value.strip().lower()
+    if email.startswith('mailto:'):
+        email = email[7:].split('?', 1)[0].strip()
+    if email.endswith('>') and '<' in email:
+        email = email[email.rindex('<')+1:-1].strip()
+    if len(email) == 0:
+        return ''
+    local, at, domain = email.rpartition('@')
+    domain = domain.rstrip('.')
+    ascii_domain = to_ascii_domain(domain)
+    if len(at) == 0 or ascii_domain is None or not EMAIL_PATTERN.fullmatch(local + '@' + ascii_domain):
+        return None
+    return local + '@' + domain
+
+def normalize_domain(value):
+    # return the canonical form of a domain (lowercase, without a scheme,
+    # path, port or www. prefix, so a website url works too; an email is
+    # reduced to its domain), a blank if there isn't one, or None if it
+    # can't be a valid domain
+    domain = value.strip().lower()
+    if len(domain) == 0:
+        return ''
+    match = URL_SCHEME_PATTERN.match(domain)
+    if match is not None:
+        domain = domain[match.end():]
+    domain = URL_PATH_PATTERN.split(domain, 1)[0].rpartition('@')[2].split(':', 1)[0].rstrip('.')
+    if domain.startswith('www.'):
+        domain = domain[4:]
+    ascii_domain = to_ascii_domain(domain)
+    if ascii_domain is None or not DOMAIN_NAME_PATTERN.fullmatch(ascii_domain):
+        return None
+    return domain
+
+def normalize_profile(value):
+    # return the canonical form of a linkedin username (lowercase, and the
+    # last part of the path if it's a profile url), a blank if there isn't
+    # one, or None if it can't be a valid username
+    profile = value.strip().lower()
+    if len(profile) == 0:
+        return ''
+    if 'linkedin.com/' in profile:
+        profile = URL_PATH_PATTERN.split(profile.split('linkedin.com/', 1)[1].rstrip('/').rsplit('/', 1)[-1], 1)[0]
+    return profile if PROFILE_PATTERN.fullmatch(profile) else None
+
+def to_ascii_domain(domain):
+    # internationalized domains are checked in their ascii (punycode) form,
+    # but are looked up as they were given
+    if domain.isascii():
+        return domain
+    try:
+        return domain.encode('idna').decode('ascii')
+    except UnicodeError:
+        return None
+
+def normalize_values(values, normalize):
+    # normalize a batch of values in a single pass before any lookups;
+    # values that can't be valid become blanks, so they're returned as
+    # blanks without calling the API
+    result = [normalize(value) for value in values]
+    invalid = 0
+    for index, value in enumerate(result):
+        if value is None:
+            result[index] = ''
+            invalid += 1
+    if _metrics is not None:
+        _metrics.count('invalid_lookups_avoided', invalid)
+    return result
+
+def normalize_rows(rows, normalizers):
+    # like normalize_values, for rows of values (e.g. an email and a profile)
+    # with a normalizer for each value; the values that can't be valid become
+    # blanks, and a row is only skipped if none of its values are left
+    result = []
+    invalid = 0
+    for row in rows:
+        normalized = tuple(normalize(value) or '' for normalize, value in zip(normalizers, row))
+        if not any(normalized) and any(value.strip() for value in row):
+            invalid += 1
+        result.append(normalized)
+    if _metrics is not None:
+        _metrics.count('invalid_lookups_avoided', invalid)
+    return result
+
+def dedupe_values(values):
+    # return the distinct (normalized) values that aren't blank, and for
+    # each of the values, the index of its distinct value (or -1 if it's
+    # blank); the values are strings or tuples of strings
+    unique = OrderedDict()
+    indexes = []
+    for value in values:
+        blank = len(value) == 0 if isinstance(value, str) else not any(value)
+        indexes.append(-1 if blank else unique.setdefault(value, len(unique)))
+    if _metrics is not None:
+        _metrics.count('duplicate_lookups_avoided', sum(1 for index in indexes if index >= 0) - len(unique))
+    return list(unique), indexes
+
+def unique_lookups(lookup, values, max_concurrency, chunk_size=None):
+    # run the lookups like iter_lookups, but only once for each distinct
+    # value, yielding the row for each of the values in order; blank values
+    # are returned as blanks without a lookup
+    unique, indexes = dedupe_values(values)
+    return expand_rows(iter_lookups(lookup, unique, max_concurrency, chunk_size), indexes)
+
+def expand_rows(rows, indexes):
+    # yield the row for each index into the rows (or a blank for -1); the
+    # rows are in the order of their first index, so each row is read when
+    # it's first needed and kept only until its last index
+    last = {index: position for position, index in enumerate(indexes)}
+    kept = {}
+    rows = iter(rows)
+    for position, index in enumerate(indexes):
+        if index < 0:
+            yield ['']
+            continue
+        row = kept.get(index)
+        if row is None:
+            row = kept[index] = next(rows)
+        if last[index] == position:
+            del kept[index]
+        yield row
+
+def iter_lookups(lookup, values, max_concurrency, chunk_size=None):
+    # run the lookups like run_lookups, but a chunk of values at a time,
+    # yielding the results of each chunk in order as soon as it's done so
+    # they can be written while the next chunk is looked up
+    chunk_size = chunk_size or OUTPUT_CHUNK_SIZE
+    for i in range(0, len(values), chunk_size):
+        for row in run_lookups(lookup, values[i:i+chunk_size], max_concurrency):
+            yield row
+
+def get_max_age(flex):
+    # get the maximum age in seconds of the stored rows a refresh can return
+    try:
+        max_age = float(dict(flex.vars).get('fullcontact_max_age', REFRESH_MAX_AGE))
+        if max_age < 0: raise ValueError
+    except (TypeError, ValueError):
+        raise ValueError
+    return max_age
+
+def refresh_rows(auth_token, name, values, properties, max_age, lookup_rows):
+    # return the rows for the values, looking up only the rows that need it;
+    # rows are stored by the function name and normalized input, with a
+    # fingerprint of the properties and the time they were fetched; the
+    # rows that aren't stored or were stored for other properties are looked
+    # up as usual (so they can come from the cache), as are the rows that
+    # were blank (so the shorter cache time for results that can't be found
+    # decides when they're looked up again rather than every refresh) or
+    # weren't complete (so a pending or timed out result that's been cached
+    # since isn't paid for again); only the rows that are older than the
+    # maximum age are fetched again without the cache
+    store = get_refresh_store()
+    auth = auth_hash(get_headers(auth_token))
+    fingerprint = hashlib.sha256(','.join(properties).encode('utf-8')).hexdigest()[:16]
+    now = time.time()
+
+    result = [None]*len(values)
+    lookups = (OrderedDict(), OrderedDict())
+    for index, value in enumerate(values):
+        key = auth + ' ' + name + ' ' + json.dumps(normalize_value(value))
+        entry = store.get(key)
+        refetch = entry is not None and entry[0] == fingerprint and any(entry[2]) and is_complete(entry[2])
+        if refetch and now - entry[1] < max_age:
+            result[index] = entry[2]
+            continue
+        lookups[refetch].setdefault(key, (value, []))[1].append(index)
+    if _metrics is not None:
+        _metrics.count('refresh_skipped', sum(1 for row in result if row is not None))
+
+    for refetch, group in enumerate(lookups):
+        if len(group) == 0:
+            continue
+        token = _refetch.set(bool(refetch))
+        try:
+            rows = lookup_rows([value for value, indexes in group.values()])
+        finally:
+            _refetch.reset(token)
+        fetched = time.time()
+        for (key, (value, indexes)), row in zip(group.items(), rows):
+            store.set(key, (fingerprint, fetched, row), REFRESH_TTL)
+            for index in indexes:
+                result[index] = row
+    return result
+
+def normalize_value(value):
+    if isinstance(value, str):
+        return value.lower().strip()
+    return [normalize_value(v) for v in value]
+
+def is_complete(row):
+    # whether a row has a result that doesn't need to be looked up again
+    # (not pending, timed out or failed)
+    return TIMED_OUT_ROW[0] not in row and PENDING_ROW[0] not in row and ERROR_ROW[0] not in row
+
+def get_refresh_store():
+    # create the shared store of rows for incremental refreshes on first use
+    global _refresh_store
+    if _refresh_store is None:
+        with _refresh_store_lock:
+            if _refresh_store is None:
+                _refresh_store = ResponseCache(REFRESH_SIZE, CACHE_PATH, CACHE_DISK_SIZE, table='refresh')
+    return _refresh_store
+
+def get_session():
+    # create the shared session on first use; after that, every call in
+    # this worker process reuses it (and its pool of keep-alive connections);
+    # requests are retried by post_request rather than the session so the
+    # retries can be fit into the call's time budget
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                # keep enough connections for every request the adaptive
+                # concurrency limit allows to be in flight
+                pool_maxsize = POOL_MAXSIZE if _concurrency_limiter is None else max(POOL_MAXSIZE, _concurrency_limiter.max_limit)
+                start = time.perf_counter()
+                _session = requests_retry_session(retries=0, status_forcelist=(), pool_connections=POOL_CONNECTIONS, pool_maxsize=pool_maxsize)
+                if _metrics is not None:
+                    _metrics.time('session', time.perf_counter() - start)
+    return _session
+
+def connection_stats():
+    # return the number of connections the shared session has opened and
+    # the number of requests that reused an already open connection
+    created, requested = 0, 0
+    if _session is not None:
+        # the same adapter is mounted for both http and https
+        for adapter in set(_session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is not None:
+                    created += pool.num_connections
+                    requested += pool.num_requests
+    return {'created': created, 'reused': max(requested - created, 0)}
+
+def get_cache():
+    # create the shared response cache on first use
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache(CACHE_SIZE, CACHE_PATH, CACHE_DISK_SIZE, stale=CACHE_STALE_TTL)
+    return _cache
+
+def post_cached(url, data, headers, ttl):
+    # post the request data to the url and return the status code and the
+    # parsed response content; results that were found (200) and results
+    # that can't be found or weren't formatted properly (400, 404, 422) are
+    # cached, with the latter kept for a shorter time; results that are
+    # pending (202) are polled in the background until they're complete
+    # so a later call can find the result in the cache
+    key = cache_key(url, data, headers)
+    cached = get_cache().get(key) if not _refetch.get() else None
+    if _metrics is not None:
+        _metrics.count('cache_hits' if cached is not None else 'cache_misses')
+    if cached is not None:
+        return cached
+
+    # if the same request is already in flight, share its result rather
+    # than sending the request again
+    return get_single_flight().do(key, lambda: post_uncached(key, url, data, headers, ttl))
+
+def post_uncached(key, url, data, headers, ttl):
+    # check the cache again in case the result was added by a request that
+    # finished after the caller checked it
+    cached = get_cache().get(key) if not _refetch.get() else None
+    if cached is not None:
+        return cached
+
+    # if the result is already being polled, it's still pending
+    poller = get_poller()
+    if poller.is_pending(key):
+        return 202, None
+
+    import requests
+    try:
+        response = post_request(url, data, headers)
+        if response.status_code == 202:
+            poller.add(key, url, data, headers, ttl)
+            return 202, None
+        return cache_response(key, response, ttl)
+    except (CircuitOpenError, requests.RequestException):
+        # if the API is down or failing, return the result from before it
+        # expired, if it's still kept, rather than an error
+        stale = get_cache().get(key, stale=True)
+        if stale is None:
+            raise
+        if _metrics is not None:
+            _metrics.count('stale_hits')
+        return stale
+
+def enable_metrics(hook=None):
+    # turn on the instrumentation; the hook, if given, is called with the
+    # metrics at the end of each call
+    global _metrics
+    _metrics = Metrics(hook)
+    return _metrics
+
+def disable_metrics():
+    global _metrics
+    _metrics = None
+
+def get_metrics():
+    return _metrics
+
+def write_metrics_file(path):
+    # return a hook that writes the metrics to the given file in the
+    # Prometheus text format (e.g. for the node exporter's textfile collector)
+    def write(metrics):
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w') as f:
+            f.write(metrics.prometheus())
+        os.replace(temp_path, path)
+    return write
+
+class Metrics:
+    # totals of the time spent in each phase of a call and counts of the
+    # events, retries and response status codes seen by this worker process
+
+    def __init__(self, hook=None):
+        self.hook = hook
+        self.timers = {}
+        self.counters = {}
+        self.statuses = {}
+        self.lock = threading.Lock()
+
+    def time(self, phase, seconds):
+        with self.lock:
+            timer = self.timers.get(phase)
+            if timer is None:
+                timer = self.timers[phase] = [0, 0.0, 0.0]
+            timer[0] += 1
+            timer[1] += seconds
+            timer[2] = max(timer[2], seconds)
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def response(self, response):
+        # count the response status code (with server errors grouped
+        # together); retries are counted by post_request
+        status_code = response.status_code
+        status = '5xx' if status_code >= 500 else str(status_code)
+        with self.lock:
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+            if status_code == 429:
+                self.counters['rate_limited'] = self.counters.get('rate_limited', 0) + 1
+
+    def snapshot(self):
+        with self.lock:
+            hits = self.counters.get('cache_hits', 0)
+            lookups = hits + self.counters.get('cache_misses', 0)
+            return {
+                'timers': {phase: {'count': t[0], 'seconds': t[1], 'max_seconds': t[2]} for phase, t in self.timers.items()},
+                'counters': dict(self.counters),
+                'statuses': dict(self.statuses),
+                'cache_hit_ratio': hits / float(lookups) if lookups > 0 else 0.0,
+                'concurrency': _concurrency_limiter.snapshot() if _concurrency_limiter is not None else None,
+                'circuit': _circuit_breaker.state if _circuit_breaker is not None else None
+            }
+
+    def prometheus(self):
+        snapshot = self.snapshot()
+        lines = [
+            '# HELP fullcontact_phase_seconds_total Time spent in each phase of a call.',
+            '# TYPE fullcontact_phase_seconds_total counter'
+        ]
+        for phase, timer in sorted(snapshot['timers'].items()):
+            lines.append('fullcontact_phase_seconds_total{phase="%s"} %f' % (phase, timer['seconds']))
+        lines.append('# HELP fullcontact_phase_count_total Number of times each phase of a call ran.')
+        lines.append('# TYPE fullcontact_phase_count_total counter')
+        for phase, timer in sorted(snapshot['timers'].items()):
+            lines.append('fullcontact_phase_count_total{phase="%s"} %d' % (phase, timer['count']))
+        lines.append('# HELP fullcontact_responses_total Number of API responses by status code.')
+        lines.append('# TYPE fullcontact_responses_total counter')
+        for status, count in sorted(snapshot['statuses'].items()):
+            lines.append('fullcontact_responses_total{status="%s"} %d' % (status, count))
+        lines.append('# HELP fullcontact_events_total Number of calls, rows, retries, cache hits and other events.')
+        lines.append('# TYPE fullcontact_events_total counter')
+        for name, count in sorted(snapshot['counters'].items()):
+            lines.append('fullcontact_events_total{event="%s"} %d' % (name, count))
+        lines.append('# HELP fullcontact_cache_hit_ratio Fraction of lookups answered by the cache.')
+        lines.append('# TYPE fullcontact_cache_hit_ratio gauge')
+        lines.append('fullcontact_cache_hit_ratio %f' % snapshot['cache_hit_ratio'])
+        if snapshot['circuit'] is not None:
+            lines.append('# HELP fullcontact_circuit_state Whether the circuit breaker is in each state (closed, open or half open).')
+            lines.append('# TYPE fullcontact_circuit_state gauge')
+            for state in ('closed', 'open', 'half_open'):
+                lines.append('fullcontact_circuit_state{state="%s"} %d' % (state, 1 if snapshot['circuit'] == state else 0))
+        concurrency = snapshot['concurrency']
+        if concurrency is not None:
+            lines.append('# HELP fullcontact_concurrency_limit Number of requests the adaptive concurrency limit allows in flight.')
+            lines.append('# TYPE fullcontact_concurrency_limit gauge')
+            lines.append('fullcontact_concurrency_limit %d' % concurrency['limit'])
+            lines.append('# HELP fullcontact_concurrency_in_flight Number of requests in flight.')
+            lines.append('# TYPE fullcontact_concurrency_in_flight gauge')
+            lines.append('fullcontact_concurrency_in_flight %d' % concurrency['in_flight'])
+            lines.append('# HELP fullcontact_concurrency_changes_total Number of changes to the adaptive concurrency limit by direction and reason.')
+            lines.append('# TYPE fullcontact_concurrency_changes_total counter')
+            for name, count in sorted(concurrency['changes'].items()):
+                direction, reason = name.split('_', 1)
+                lines.append('fullcontact_concurrency_changes_total{direction="%s",reason="%s"} %d' % (direction, reason, count))
+        return '\n'.join(lines) + '\n'
+
+    def emit(self):
+        if self.hook is not None:
+            self.hook(self)
+
+def get_single_flight():
+    # create the shared group of in-flight requests on first use
+    global _single_flight
+    if _single_flight is None:
+        with _single_flight_lock:
+            if _single_flight is None:
+                _single_flight = SingleFlight()
+    return _single_flight
+
+class SingleFlight:
+    # runs one call at a time for each key; callers asking for a key that's
+    # already being called wait for and share the result of that call; the
+    # number of calls that were shared rather than run is kept in coalesced
+
+    def __init__(self):
+        self.calls = {}
+        self.coalesced = 0
+        self.lock = threading.Lock()
+
+    def do(self, key, fn):
+        leader = False
+        with self.lock:
+            future = self.calls.get(key)
+            if future is None:
+                future = self.calls[key] = Future()
+                leader = True
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            if _metrics is not None:
+                _metrics.count('coalesced')
+            deadline = _deadline.get()
+            if deadline is None:
+                return future.result()
+            try:
+                return future.result(timeout=max(deadline - time.monotonic(), 0))
+            except FutureTimeoutError:
+                raise DeadlineExceeded()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self.lock:
+                del self.calls[key]
+
+def post_request(url, data, headers):
+    # wait for the rate limiter before each request; if the request is
+    # rate limited anyway (429), the rate limiter backs off using the
+    # response headers and the request is tried again; server errors and
+    # connection errors are tried again with exponential backoff; the waits
+    # and the requests are all limited to the time left before the call's
+    # deadline, and if there isn't time for a retry, the last response (or
+    # error) is returned; with adaptive concurrency, each request also waits
+    # for a slot and reports how it went so the limit can be adjusted; while
+    # the circuit breaker is open, requests (and retries) fail right away
+    import requests
+    rate_limiter = get_rate_limiter()
+    concurrency_limiter = _concurrency_limiter
+    circuit_breaker = get_circuit_breaker()
+    metrics = _metrics
+    deadline = _deadline.get()
+    rate_limited = 0
+    failures = 0
+    while True:
+        if circuit_breaker is not None and not circuit_breaker.allow(deadline):
+            if metrics is not None:
+                metrics.count('circuit_rejected')
+            raise CircuitOpenError(circuit_breaker.retry_in())
+        start = time.perf_counter()
+        try:
+            rate_limiter.acquire(deadline)
+            limited = time.perf_counter()
+            if concurrency_limiter is not None:
+                concurrency_limiter.acquire(deadline)
+        except BaseException:
+            if circuit_breaker is not None:
+                circuit_breaker.record(None)
+            raise
+        acquired = time.perf_counter()
+        try:
+            response = get_session().post(url, data=data, headers=headers, timeout=get_timeout(deadline))
+        except (requests.ConnectionError, requests.Timeout) as e:
+            # running into the call's own deadline says nothing about the
+            # API, so it doesn't count against the limit or the circuit
+            expired = deadline is not None and time.monotonic() >= deadline
+            if concurrency_limiter is not None:
+                concurrency_limiter.release(None if expired else ('timeout' if isinstance(e, requests.Timeout) else 'connection_error'))
+            if circuit_breaker is not None:
+                circuit_breaker.record(None if expired else False)
+            if expired:
+                raise DeadlineExceeded()
+            failures += 1
+            if failures > SERVER_RETRIES or not backoff(failures, deadline):
+                raise
+            continue
+        except BaseException:
+            if concurrency_limiter is not None:
+                concurrency_limiter.release(None)
+            if circuit_breaker is not None:
+                circuit_breaker.record(None)
+            raise
+        latency = time.perf_counter() - acquired
+        if concurrency_limiter is not None:
+            concurrency_limiter.release(get_outcome(response.status_code), latency)
+        if circuit_breaker is not None:
+            # a 429 means the API is up but busy, so it doesn't count either way
+            circuit_breaker.record(None if response.status_code == 429 else response.status_code < 500)
+        if metrics is not None:
+            metrics.time('rate_limit', limited - start)
+            if concurrency_limiter is not None:
+                metrics.time('concurrency', acquired - limited)
+            metrics.time('network', latency)
+            metrics.response(response)
+        rate_limiter.update(response.status_code, response.headers)
+
+        if response.status_code == 429 and rate_limited < RATE_LIMIT_RETRIES:
+            rate_limited += 1
+            continue
+        if response.status_code in SERVER_RETRY_STATUSES and failures < SERVER_RETRIES:
+            failures += 1
+            if backoff(failures, deadline):
+                continue
+        return response
+
+class CircuitOpenError(ConnectionError):
+    # raised instead of making a request while the circuit breaker is open
+
+    def __init__(self, retry_in):
+        ConnectionError.__init__(self, 'FullContact is unavailable after repeated failures; try again in %d seconds' % max(int(round(retry_in)), 1))
+
+def backoff(failures, deadline):
+    # wait before trying a request again; returns False without waiting if
+    # the retry wouldn't have time to finish before the deadline
+    delay = SERVER_RETRY_BACKOFF * (2 ** (failures - 1))
+    if deadline is not None and time.monotonic() + delay >= deadline:
+        return False
+    if _metrics is not None:
+        _metrics.count('retries')
+    time.sleep(delay)
+    return True
+
+def cache_response(key, response, ttl):
+    status_code = response.status_code
+    if status_code == 400 or status_code == 404 or status_code == 422:
+        get_cache().set(key, (status_code, None), CACHE_NEGATIVE_TTL)
+        return status_code, None
+
+    # return an error for any other non-200 result
+    response.raise_for_status()
+
+    # cache the json text of the result; it's decoded when it's used, and
+    # then only the fields needed for the requested properties
+    content = response.content.decode('utf-8')
+    get_cache().set(key, (status_code, content), ttl)
+    return status_code, content
+
+def get_poller():
+    # create the shared poller for pending results on first use
+    global _poller
+    if _poller is None:
+        with _poller_lock:
+            if _poller is None:
+                _poller = PendingPoller(PENDING_POLL_DELAY, PENDING_POLL_ATTEMPTS)
+    return _poller
+
+class PendingPoller:
+    # polls pending results on a background thread with exponential backoff;
+    # the pending requests include the api key, so they're only kept in
+    # memory and not in the on-disk cache
+
+    def __init__(self, delay, attempts):
+        self.delay = delay
+        self.attempts = attempts
+        self.pending = {}
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def is_pending(self, key):
+        with self.condition:
+            return key in self.pending
+
+    def add(self, key, url, data, headers, ttl):
+        with self.condition:
+            if key in self.pending:
+                return
+            self.pending[key] = {
+                'request': (url, data, headers, ttl),
+                'due': time.monotonic() + self.delay,
+                'delay': self.delay,
+                'attempts': 0
+            }
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+            self.condition.notify()
+
+    def run(self):
+        import requests
+        while True:
+            # wait until the next pending result is due to be polled
+            with self.condition:
+                if len(self.pending) == 0:
+                    self.condition.wait()
+                    continue
+                key, item = min(self.pending.items(), key=lambda entry: entry[1]['due'])
+                wait = item['due'] - time.monotonic()
+                if wait > 0:
+                    self.condition.wait(wait)
+                    continue
+
+            url, data, headers, ttl = item['request']
+            try:
+                response = post_request(url, data, headers)
+                if response.status_code != 202:
+                    cache_response(key, response, ttl)
+                status_code = response.status_code
+            except CircuitOpenError:
+                # the API is down, so try again later like a pending result
+                status_code = 202
+            except requests.RequestException:
+                status_code = None
+
+            # if the result is still pending, poll again after twice the
+            # delay; otherwise, the result (if any) is now in the cache
+            with self.condition:
+                item['attempts'] += 1
+                if status_code == 202 and item['attempts'] < self.attempts:
+                    item['delay'] *= 2
+                    item['due'] = time.monotonic() + item['delay']
+                else:
+                    del self.pending[key]
+
+def get_circuit_breaker():
+    # create the shared circuit breaker on first use; None if it's turned off
+    global _circuit_breaker
+    if _circuit_breaker is None and CIRCUIT_FAILURES > 0:
+        with _circuit_breaker_lock:
+            if _circuit_breaker is None:
+                _circuit_breaker = CircuitBreaker(CIRCUIT_FAILURES, CIRCUIT_RESET_TIMEOUT)
+    return _circuit_breaker
+
+class CircuitBreaker:
+    # counts the failed requests (server errors and connection errors) in a
+    # row and opens after the threshold; while open, no requests are allowed
+    # until the reset time has passed, and then the circuit is half open and
+    # one request at a time is allowed through as a probe while the others
+    # wait for it: a probe that succeeds closes the circuit (and lets the
+    # others through) and one that fails opens it again (and fails the
+    # others); each allowed request reports its outcome with record() (True,
+    # False, or None if it didn't get an answer from the API)
+
+    def __init__(self, threshold, reset_timeout):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.opened = 0.0
+        self.probing = False
+        self.condition = threading.Condition()
+
+    def allow(self, deadline=None):
+        with self.condition:
+            while self.state == 'half_open' and self.probing:
+                timeout = None
+                if deadline is not None:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        raise DeadlineExceeded()
+                self.condition.wait(timeout)
+            if self.state == 'closed':
+                return True
+            if self.state == 'open':
+                if time.monotonic() - self.opened < self.reset_timeout:
+                    return False
+                self.state = 'half_open'
+            self.probing = True
+            if _metrics is not None:
+                _metrics.count('circuit_probes')
+            return True
+
+    def record(self, success):
+        with self.condition:
+            probe = self.state == 'half_open' and self.probing
+            if probe:
+                self.probing = False
+                self.condition.notify_all()
+            if success is None:
+                return
+            if success:
+                self.failures = 0
+                if self.state != 'closed':
+                    self.state = 'closed'
+                    if _metrics is not None:
+                        _metrics.count('circuit_closed')
+                return
+            self.failures += 1
+            if probe or (self.state == 'closed' and self.failures >= self.threshold):
+                self.state = 'open'
+                self.opened = time.monotonic()
+                if _metrics is not None:
+                    _metrics.count('circuit_opened')
+
+    def retry_in(self):
+        with self.condition:
+            return max(self.opened + self.reset_timeout - time.monotonic(), 0)
+
+def get_rate_limiter():
+    # create the shared rate limiter on first use
+    global _rate_limiter
+    if _rate_limiter is None:
+        with _rate_limiter_lock:
+            if _rate_limiter is None:
+                _rate_limiter = RateLimiter(RATE_LIMIT, RATE_LIMIT_BURST, RATE_LIMIT_SHARE)
+    return _rate_limiter
+
+class RateLimiter:
+    # token bucket rate limiter; tokens are added at the current rate up to
+    # the burst size and each request takes one token; the rate is adjusted
+    # from the X-Rate-Limit-* headers and requests are held back after a 429
+    # for the time given by the Retry-After (or X-Rate-Limit-Reset) header;
+    # with a share, the limiter uses that fraction of the rate and burst
+
+    def __init__(self, rate, burst, share=1.0):
+        self.share = share
+        self.rate = rate * share
+        self.burst = max(int(burst * share), 1)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self, deadline=None):
+        # wait for a token; if there's a deadline and the wait would go past
+        # it, give up rather than wait for a request that can't finish
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                wait = self.blocked_until - now
+                if wait <= 0:
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            if deadline is not None and now + wait >= deadline:
+                raise DeadlineExceeded()
+            time.sleep(wait)
+
+    def update(self, status_code, headers):
+        remaining = header_number(headers, 'X-Rate-Limit-Remaining', 'X-RateLimit-Remaining')
+        reset = header_number(headers, 'X-Rate-Limit-Reset', 'X-RateLimit-Reset')
+        retry_after = header_number(headers, 'Retry-After')
+        with self.lock:
+            now = time.monotonic()
+
+            # spread this process's share of the requests that are left over
+            # the time until the limit resets
+            if remaining is not None and remaining >= 1 and reset is not None and reset > 0:
+                self.rate = max(remaining / reset * self.share, MIN_RATE_LIMIT)
+
+            # if we're out of requests or were rate limited, hold back all
+            # requests until the limit resets; the wait is jittered so
+            # workers that were limited at the same time don't all retry
+            # at the same time
+            wait = None
+            if status_code == 429:
+                wait = retry_after if retry_after is not None else (reset if reset is not None else 1)
+            elif remaining is not None and remaining < 1 and reset is not None:
+                wait = reset
+            if wait is not None:
+                self.tokens = 0.0
+                self.blocked_until = max(self.blocked_until, now + wait * random.uniform(1, 1.1))
+
+def enable_adaptive_concurrency(max_limit, min_limit=None, initial=None):
+    # turn on the adaptive limit on the number of requests in flight in this
+    # worker process
+    global _concurrency_limiter
+    min_limit = ADAPTIVE_MIN_CONCURRENCY if min_limit is None else min_limit
+    initial = DEFAULT_CONCURRENCY if initial is None else initial
+    _concurrency_limiter = ConcurrencyLimiter(initial, min_limit, max_limit, ADAPTIVE_LATENCY_TOLERANCE)
+    return _concurrency_limiter
+
+def disable_adaptive_concurrency():
+    global _concurrency_limiter
+    _concurrency_limiter = None
+
+def get_concurrency_limiter():
+    return _concurrency_limiter
+
+def get_outcome(status_code):
+    # classify a response for the concurrency limiter; results that were
+    # found, not found or are pending all mean the API is keeping up
+    if status_code == 429:
+        return 'rate_limited'
+    if status_code >= 500:
+        return 'server_error'
+    return 'ok'
+
+class ConcurrencyLimiter:
+    # additive increase, multiplicative decrease (AIMD) limit on the number
+    # of requests in flight; each healthy response adds 1/limit to the limit
+    # (so it grows by one for each limit's worth of responses) while the
+    # limit is being used (at least half of it is in flight), and a 429, a
+    # server error, a timeout or a connection error cuts it in half; the latency of the healthy responses is
+    # smoothed and compared with the lowest smoothed latency seen (which
+    # drifts up slowly so it follows lasting changes), and latency that's
+    # risen past the tolerance cuts the limit back a little, since it means
+    # requests are queueing; the limit is only cut once for each round trip
+    # so a burst of errors from the requests that were already in flight
+    # doesn't cut it more than once; the number of changes in each direction
+    # for each reason is kept in changes
+
+    def __init__(self, limit, min_limit, max_limit, tolerance):
+        self.min_limit = max(min_limit, 1)
+        self.max_limit = max(max_limit, self.min_limit)
+        self.limit = float(min(max(limit, self.min_limit), self.max_limit))
+        self.tolerance = tolerance
+        self.in_flight = 0
+        self.latency = None
+        self.baseline = None
+        self.decreased = 0.0
+        self.changes = {}
+        self.condition = threading.Condition()
+
+    def acquire(self, deadline=None):
+        # wait for a request to be allowed in flight; if there's a deadline
+        # and it passes first, give up rather than wait
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                timeout = None
+                if deadline is not None:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        raise DeadlineExceeded()
+                self.condition.wait(timeout)
+            self.in_flight += 1
+
+    def release(self, outcome, latency=None):
+        # the outcome is 'ok' for a healthy response, the reason to cut the
+        # limit for an unhealthy one, or None if the request says nothing
+        # about the API (e.g. it ran out of the call's time)
+        with self.condition:
+            in_flight = self.in_flight
+            self.in_flight -= 1
+            now = time.monotonic()
+            if outcome == 'ok':
+                if latency is not None:
+                    self.latency = latency if self.latency is None else self.latency*0.8 + latency*0.2
+                    self.baseline = self.latency if self.baseline is None else min(self.baseline*1.001, self.latency)
+                if self.latency > self.baseline*self.tolerance:
+                    self.decrease(now, ADAPTIVE_LATENCY_BACKOFF, 'latency')
+                elif in_flight*2 >= self.limit and self.limit < self.max_limit:
+                    limit = self.limit
+                    self.limit = min(self.limit + 1/self.limit, self.max_limit)
+                    if int(self.limit) > int(limit):
+                        self.change('increase', 'healthy')
+            elif outcome is not None:
+                self.decrease(now, ADAPTIVE_BACKOFF, outcome)
+            self.condition.notify_all()
+
+    def decrease(self, now, factor, reason):
+        if now - self.decreased < (self.latency or 0) or self.limit <= self.min_limit:
+            return
+        self.decreased = now
+        self.limit = max(self.limit*factor, self.min_limit)
+        self.change('decrease', reason)
+
+    def change(self, direction, reason):
+        name = direction + '_' + reason
+        self.changes[name] = self.changes.get(name, 0) + 1
+
+    def snapshot(self):
+        with self.condition:
+            return {
+                'limit': int(self.limit),
+                'in_flight': self.in_flight,
+                'min_limit': self.min_limit,
+                'max_limit': self.max_limit,
+                'latency_seconds': self.latency or 0.0,
+                'baseline_seconds': self.baseline or 0.0,
+                'changes': dict(self.changes)
+            }
+
+def header_number(headers, *names):
+    # return the first of the named headers as a number, or None if none
+    # of them are present or the value isn't a number
+    for name in names:
+        value = headers.get(name)
+        if value is None:
+            continue
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return None
+
+def cache_key(url, data, headers):
+    # results are cached per api key so one account's results are never
+    # returned for another account's lookups
+    return auth_hash(headers) + ' ' + url + ' ' + data
+
+def auth_hash(headers):
+    return hashlib.sha256(headers.get('Authorization', '').encode('utf-8')).hexdigest()[:16]
+
+class ResponseCache:
+    # least-recently-used cache of responses with a time-to-live for each
+    # entry; entries are kept in memory and, if a path is given, also in a
+    # sqlite database so they're shared with the other worker processes on
+    # the host and available after the worker restarts; the database is in
+    # WAL mode so readers in any process don't block each other or a writer,
+    # and each write is its own transaction so it's never seen half done;
+    # errors from the database (e.g. when it's locked by another process for
+    # longer than the timeout) are treated as misses rather than failing the
+    # lookup; with a stale time, entries are kept for that many seconds after
+    # they expire and can still be read by asking for stale entries (e.g.
+    # when the API is down)
+
+    def __init__(self, size, path=None, disk_size=None, timeout=CACHE_TIMEOUT, table='cache', stale=0):
+        self.size = size
+        self.table = table
+        self.stale = stale
+        self.disk_size = disk_size or size
+        self.path = path
+        self.timeout = timeout
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.writes = 0
+        self.connections = []
+        if path:
+            self._open()
+
+    def get(self, key, stale=False):
+        now = time.time()
+        oldest = now - self.stale if stale else now
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires > oldest:
+                    self.entries.move_to_end(key)
+                    return value
+                if expires <= now - self.stale:
+                    del self.entries[key]
+        if self.path is None:
+            return None
+
+        # look in the database outside the lock so threads can read at the
+        # same time; the entry may have been added by another process
+        row = self._execute('SELECT value, expires FROM %s WHERE key = ? AND expires > ?' % self.table, (key, oldest))
+        if row is None:
+            return None
+        value, expires = tuple(json.loads(row[0])), row[1]
+        with self.lock:
+            self._set_memory(key, value, expires)
+        return value
+
+    def set(self, key, value, ttl):
+        if ttl <= 0:
+            return
+        expires = time.time() + ttl
+        with self.lock:
+            self._set_memory(key, value, expires)
+            self.writes += 1
+            compact = self.writes % 1000 == 0
+        if self.path is None:
+            return
+
+        self._execute('INSERT OR REPLACE INTO %s (key, value, expires) VALUES (?, ?, ?)' % self.table, (key, json.dumps(value), expires))
+        if compact:
+            self.compact()
+
+    def compact(self):
+        # remove expired entries and the entries closest to expiring past the
+        # size limit, then give the free pages back to the file system; each
+        # process does this every so often, so the database stays within the
+        # size limit however many processes are writing to it
+        self._execute('DELETE FROM %s WHERE expires <= ?' % self.table, (time.time() - self.stale,))
+        self._execute('DELETE FROM %s WHERE key IN (SELECT key FROM %s ORDER BY expires DESC LIMIT -1 OFFSET ?)' % (self.table, self.table), (self.disk_size,))
+        self._execute('PRAGMA incremental_vacuum', ())
+
+    def _open(self):
+        # set up the database; when many processes open a new database at
+        # once, this can fail with 'database is locked' even after the
+        # timeout (switching to WAL mode doesn't wait for the lock), so it's
+        # tried again after a random wait, and if it still can't be set up,
+        # the cache is kept in memory only rather than failing the lookups
+        import sqlite3
+        for attempt in range(CACHE_OPEN_ATTEMPTS):
+            db = None
+            try:
+                db = self._connect()
+                with db:
+                    db.execute('CREATE TABLE IF NOT EXISTS %s (key TEXT PRIMARY KEY, value TEXT, expires REAL)' % self.table)
+                    db.execute('CREATE INDEX IF NOT EXISTS %s_expires ON %s (expires)' % (self.table, self.table))
+                self.connections.append(db)
+                return
+            except sqlite3.Error:
+                if db is not None:
+                    db.close()
+                time.sleep(random.uniform(0, 0.1 * 2**attempt))
+        if _metrics is not None:
+            _metrics.count('cache_unavailable')
+        self.path = None
+
+    def _connect(self):
+        import sqlite3
+        db = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False, isolation_level=None)
+        db.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        db.execute('PRAGMA journal_mode = WAL')
+        db.execute('PRAGMA synchronous = NORMAL')
+        return db
+
+    def _execute(self, sql, params):
+        # run a statement on a connection from the pool and return the first
+        # row of the result; each thread takes its own connection so
+        # statements run concurrently
+        import sqlite3
+        with self.lock:
+            db = self.connections.pop() if len(self.connections) > 0 else None
+        try:
+            if db is None:
+                db = self._connect()
+            rows = db.execute(sql, params).fetchall()
+            return rows[0] if len(rows) > 0 else None
+        except sqlite3.Error:
+            return None
+        finally:
+            if db is not None:
+                with self.lock:
+                    self.connections.append(db)
+
+    def _set_memory(self, key, value, expires):
+        self.entries[key] = (value, expires)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+def requests_retry_session(
+    retries=3,
+    backoff_factor=0.3,
+    status_forcelist=(429, 500, 502, 503, 504),
+    session=None,
+    pool_connections=10,
+    pool_maxsize=10,
+):
+    import requests
+    from requests.adapters import HTTPAdapter
+    from requests.packages.urllib3.util.retry import Retry
+    session = session or requests.Session()
+
+    # the lookups are POSTs, which aren't retried by default; they only
+    # read data, so they're safe to retry; once the retries are used up,
+    # the last response is returned so the caller can check its status;
+    # the Retry-After header is handled by the rate limiter instead
+    retry = Retry(
+        total=retries,
+        read=retries,
+        connect=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=status_forcelist,
+        allowed_methods=None,
+        raise_on_status=False,
+        respect_retry_after_header=False,
+    )
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+def validator_list(field, value, error):
+    if isinstance(value, str):
+        return
+    if isinstance(value, list):
+        for item in value:
+            if not isinstance(item, str):
+                error(field, 'Must be a list with only string values')
+        return
+    error(field, 'Must be a string or a list of strings')
+
+def to_string(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+def to_range(value):
+    # if we have a single value, create a list from it; if we have a range
+    # of values (a list of lists), flatten it into a single list of values;
+    # empty cells in the range are treated as blank values
+    if isinstance(value, str):
+        return [value]
+    if isinstance(value, list):
+        values = itertools.chain.from_iterable(v if isinstance(v, list) else [v] for v in value)
+        return ['' if v is None else v for v in values]
+    return None
+
+def to_list(value):
+    # if we have a list of strings, create a list from them; if we have
+    # a list of lists, flatten it into a single list of strings
+    if isinstance(value, str):
+        return value.split(",")
+    if isinstance(value, list):
+        return list(itertools.chain.from_iterable(value))
+    return None
+
+# if a metrics file is given, turn on the instrumentation and write the
+# metrics to the file after each call
+if METRICS_PATH:
+    enable_metrics(write_metrics_file(METRICS_PATH))
+
+# if a maximum is given, turn on the adaptive concurrency limit
+if ADAPTIVE_CONCURRENCY > 0:
+    enable_adaptive_concurrency(ADAPTIVE_CONCURRENCY)
@@ -0,0 +1,31 @@
+# shared setup for the tests; the shared code and the benchmark harness
+# (whose stub server and function loader the tests use) are imported from
+# the repository root
+
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+@pytest.fixture
+def clock(monkeypatch):
+    # a clock for time.time() that only moves when the test moves it
+    import fullcontact_core
+
+    class Clock:
+        def __init__(self):
+            self.now = 1000000.0
+
+        def __call__(self):
+            return self.now
+
+        def advance(self, seconds):
+            self.now += seconds
+
+    clock = Clock()
+    monkeypatch.setattr(fullcontact_core.time, 'time', clock)
+    return clock
@@ -0,0 +1,134 @@
+# tests for the bulk runner; the lookups are replaced with a fake lookup
+# that returns a row made from the input value, so a run can be
+# interrupted part way and resumed without calling the API
+
+import os
+import json
+
+import pytest
+
+import fullcontact_bulk
+from fullcontact_bulk import run, get_output_columns, get_shard, NORMALIZERS
+
+class Interrupted(Exception):
+    pass
+
+class FakeLookup:
+    # looks up a chunk of rows, failing on the chunk after the given number
+    # of chunks (like a run that's interrupted); records each value looked up
+    def __init__(self, fail_after=None):
+        self.fail_after = fail_after
+        self.chunks = 0
+        self.values = []
+
+    def get_lookup(self, function, auth_token, projection, max_concurrency, width=None, org_projection=None):
+        return self.lookup
+
+    def lookup(self, rows):
+        if self.fail_after is not None and self.chunks >= self.fail_after:
+            raise Interrupted()
+        self.chunks += 1
+        self.values.extend(values[0] for values in rows)
+        return [['Name ' + values[0], 'Title ' + values[0]] for values in rows]
+
+def write_input(path, format, count):
+    emails = ['user%d@example.com' % i for i in range(count)]
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        if format == 'csv':
+            f.write('email,id\n')
+            for i, email in enumerate(emails):
+                f.write('%s,%d\n' % (email, i))
+        else:
+            for i, email in enumerate(emails):
+                f.write(json.dumps({'email': email, 'id': i}) + '\n')
+
+def enrich(monkeypatch, lookup, input_path, output_path):
+    monkeypatch.setattr(fullcontact_bulk, 'get_lookup', lookup.get_lookup)
+    return run('enrich-people', input_path, output_path, 'token', properties='full_name, title', chunk_size=10)
+
+@pytest.mark.parametrize('format', ['csv', 'jsonl'])
+def test_resume(monkeypatch, tmp_path, format):
+    input_path = str(tmp_path / ('input.' + format))
+    output_path = str(tmp_path / ('output.' + format))
+    expected_path = str(tmp_path / ('expected.' + format))
+    write_input(input_path, format, 95)
+
+    # the run is interrupted after three chunks, leaving a checkpoint
+    lookup = FakeLookup(fail_after=3)
+    with pytest.raises(Interrupted):
+        enrich(monkeypatch, lookup, input_path, output_path)
+    with open(output_path + '.checkpoint') as f:
+        assert json.load(f)['rows'] == 30
+
+    # output written after the checkpoint (e.g. a partial chunk) is removed
+    with open(output_path, 'a', encoding='utf-8') as f:
+        f.write('partial row')
+
+    # the resumed run only looks up the rows that weren't done, and the
+    # output is the same as a run that wasn't interrupted
+    lookup = FakeLookup()
+    assert enrich(monkeypatch, lookup, input_path, output_path) == 95
+    assert lookup.values == ['user%d@example.com' % i for i in range(30, 95)]
+    assert not os.path.exists(output_path + '.checkpoint')
+
+    enrich(monkeypatch, FakeLookup(), input_path, expected_path)
+    with open(output_path, encoding='utf-8') as output, open(expected_path, encoding='utf-8') as expected:
+        assert output.read() == expected.read()
+
+def test_output(monkeypatch, tmp_path):
+    input_path = str(tmp_path / 'input.csv')
+    output_path = str(tmp_path / 'output.csv')
+    with open(input_path, 'w', encoding='utf-8') as f:
+        f.write('email,title\nUser@Example.com,Hobbit\nnot-an-email,Wizard\nuser@example.com,Hobbit\n')
+
+    # the input values are normalized, so the invalid email isn't looked up
+    # and the duplicate is looked up once; the title column added doesn't
+    # overwrite the input title column
+    lookup = FakeLookup()
+    enrich(monkeypatch, lookup, input_path, output_path)
+    assert lookup.values == ['user@example.com']
+    with open(output_path, encoding='utf-8') as f:
+        assert f.read().splitlines() == [
+            'email,title,full_name,fullcontact_title',
+            'User@Example.com,Hobbit,Name user@example.com,Title user@example.com',
+            'not-an-email,Wizard,,',
+            'user@example.com,Hobbit,Name user@example.com,Title user@example.com'
+        ]
+
+def test_byte_order_mark(monkeypatch, tmp_path):
+    # a CSV with a byte order mark (e.g. from Excel) is read by its columns
+    input_path = str(tmp_path / 'input.csv')
+    output_path = str(tmp_path / 'output.csv')
+    with open(input_path, 'w', encoding='utf-8-sig') as f:
+        f.write('email\nuser@example.com\n')
+    lookup = FakeLookup()
+    enrich(monkeypatch, lookup, input_path, output_path)
+    assert lookup.values == ['user@example.com']
+    with open(output_path, encoding='utf-8') as f:
+        assert f.read().splitlines()[0] == 'email,full_name,title'
+
+def test_missing_column(monkeypatch, tmp_path):
+    # a column that isn't in the input is an error before any lookups
+    input_path = str(tmp_path / 'input.csv')
+    output_path = str(tmp_path / 'output.csv')
+    with open(input_path, 'w', encoding='utf-8') as f:
+        f.write('e-mail\nuser@example.com\n')
+    lookup = FakeLookup()
+    with pytest.raises(ValueError):
+        enrich(monkeypatch, lookup, input_path, output_path)
+    assert lookup.values == []
+    assert not os.path.exists(output_path)
+
+def test_output_columns():
+    assert get_output_columns(['full_name', 'title'], {'email': ''}) == ['full_name', 'title']
+    assert get_output_columns(['full_name', 'title'], {'title': ''}) == ['full_name', 'fullcontact_title']
+    assert get_output_columns(['title'], {'title': '', 'fullcontact_title': ''}) == ['fullcontact_fullcontact_title']
+
+def test_shard():
+    # the forms of a value that are looked up as the same value are sent
+    # to the same shard
+    normalizers = NORMALIZERS['enrich-org']
+    shards = set(get_shard([value], normalizers, 16) for value in ['example.com', 'https://www.Example.com/about', 'user@example.com'])
+    assert len(shards) == 1
+    normalizers = NORMALIZERS['find-person']
+    assert get_shard(['', 'https://linkedin.com/in/Bilbo'], normalizers, 16) == get_shard(['not-an-email', 'bilbo'], normalizers, 16)
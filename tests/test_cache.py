@@ -0,0 +1,104 @@
+# tests for the response cache, in memory and with the sqlite database
+
+import pytest
+
+from fullcontact_core import ResponseCache
+
+@pytest.fixture(params=['memory', 'disk'])
+def path(request, tmp_path):
+    return str(tmp_path / 'cache.db') if request.param == 'disk' else None
+
+def test_ttl(clock, path):
+    cache = ResponseCache(10, path)
+    cache.set('a', (200, 'a'), 60)
+    assert cache.get('a') == (200, 'a')
+    clock.advance(59)
+    assert cache.get('a') == (200, 'a')
+    clock.advance(1)
+    assert cache.get('a') is None
+
+def test_no_ttl(clock, path):
+    cache = ResponseCache(10, path)
+    cache.set('a', (200, 'a'), 0)
+    assert cache.get('a') is None
+
+def test_lru(clock):
+    # reading an entry makes it the most recently used, so the entry that
+    # hasn't been read for longest is dropped first
+    cache = ResponseCache(2)
+    cache.set('a', (200, 'a'), 60)
+    cache.set('b', (200, 'b'), 60)
+    assert cache.get('a') == (200, 'a')
+    cache.set('c', (200, 'c'), 60)
+    assert cache.get('b') is None
+    assert cache.get('a') == (200, 'a')
+    assert cache.get('c') == (200, 'c')
+
+def test_stale(clock, path):
+    cache = ResponseCache(10, path, stale=100)
+    cache.set('a', (200, 'a'), 60)
+    clock.advance(60)
+    assert cache.get('a') is None
+    assert cache.get('a', stale=True) == (200, 'a')
+    clock.advance(99)
+    assert cache.get('a', stale=True) == (200, 'a')
+    clock.advance(1)
+    assert cache.get('a', stale=True) is None
+
+def test_no_stale(clock, path):
+    cache = ResponseCache(10, path)
+    cache.set('a', (200, 'a'), 60)
+    clock.advance(60)
+    assert cache.get('a', stale=True) is None
+
+def test_lru_falls_back_to_disk(clock, tmp_path):
+    # entries dropped from memory are still read from the database
+    cache = ResponseCache(1, str(tmp_path / 'cache.db'))
+    cache.set('a', (200, 'a'), 60)
+    cache.set('b', (200, 'b'), 60)
+    assert list(cache.entries) == ['b']
+    assert cache.get('a') == (200, 'a')
+    assert list(cache.entries) == ['a']
+
+def test_shared_database(clock, tmp_path):
+    # another cache on the same database (e.g. in another process) reads
+    # the entries the first one wrote
+    path = str(tmp_path / 'cache.db')
+    ResponseCache(10, path).set('a', (200, 'a'), 60)
+    cache = ResponseCache(10, path)
+    assert cache.get('a') == (200, 'a')
+    clock.advance(60)
+    assert ResponseCache(10, path).get('a') is None
+
+def test_compact(clock, tmp_path):
+    # compacting removes the expired entries and the entries closest to
+    # expiring past the size limit of the database
+    path = str(tmp_path / 'cache.db')
+    cache = ResponseCache(10, path, disk_size=2)
+    cache.set('a', (200, 'a'), 5)
+    cache.set('b', (200, 'b'), 30)
+    cache.set('c', (200, 'c'), 40)
+    cache.set('d', (200, 'd'), 50)
+    clock.advance(10)
+    cache.compact()
+    reader = ResponseCache(10, path)
+    assert [reader.get(key) for key in 'abcd'] == [None, None, (200, 'c'), (200, 'd')]
+
+def test_compact_stale(clock, tmp_path):
+    # entries are only removed once they're past their stale time
+    path = str(tmp_path / 'cache.db')
+    cache = ResponseCache(10, path, stale=10)
+    cache.set('a', (200, 'a'), 5)
+    cache.set('b', (200, 'b'), 15)
+    clock.advance(20)
+    cache.compact()
+    reader = ResponseCache(10, path, stale=10)
+    assert [reader.get(key, stale=True) for key in 'ab'] == [None, (200, 'b')]
+
+def test_unavailable_database(clock, tmp_path, monkeypatch):
+    # if the database can't be set up, the cache is kept in memory only
+    monkeypatch.setattr('fullcontact_core.CACHE_OPEN_ATTEMPTS', 1)
+    cache = ResponseCache(10, str(tmp_path / 'missing' / 'cache.db'))
+    assert cache.path is None
+    cache.set('a', (200, 'a'), 60)
+    assert cache.get('a') == (200, 'a')
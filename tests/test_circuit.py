@@ -0,0 +1,150 @@
+# tests for the circuit breaker and the stale results returned while the
+# API is down; the breaker's reset time runs on a fake clock
+
+import json
+import threading
+
+import pytest
+import requests
+
+import fullcontact_core
+from fullcontact_core import CircuitBreaker, CircuitOpenError, post_uncached, get_headers
+from harness import reset_state
+from stub_server import StubServer
+
+@pytest.fixture
+def monotonic(monkeypatch):
+    # a clock for time.monotonic() that only moves when the test moves it
+    now = [1000.0]
+    monkeypatch.setattr(fullcontact_core.time, 'monotonic', lambda: now[0])
+    return now
+
+def open_breaker(breaker):
+    for i in range(breaker.threshold):
+        breaker.allow()
+        breaker.record(False)
+    assert breaker.state == 'open'
+
+def start_waiting(breaker):
+    # call allow() on another thread; returns the thread and its result
+    result = []
+    thread = threading.Thread(target=lambda: result.append(breaker.allow()), daemon=True)
+    thread.start()
+    thread.join(0.1)
+    return thread, result
+
+def test_opens_after_threshold(monotonic):
+    breaker = CircuitBreaker(3, 30)
+    for i in range(2):
+        assert breaker.allow()
+        breaker.record(False)
+    assert breaker.state == 'closed'
+
+    # a success resets the count, so only failures in a row open it
+    breaker.record(True)
+    for i in range(2):
+        breaker.record(False)
+    assert breaker.state == 'closed'
+    breaker.record(False)
+    assert breaker.state == 'open'
+    assert not breaker.allow()
+    assert breaker.retry_in() == 30
+
+def test_half_open_probe_closes(monotonic):
+    breaker = CircuitBreaker(2, 30)
+    open_breaker(breaker)
+    monotonic[0] += 29
+    assert not breaker.allow()
+
+    # after the reset time, one request is let through as a probe and the
+    # others wait for it
+    monotonic[0] += 1
+    assert breaker.allow()
+    assert breaker.state == 'half_open'
+    thread, result = start_waiting(breaker)
+    assert thread.is_alive() and result == []
+
+    # the probe succeeds, so the circuit closes and the others go through
+    breaker.record(True)
+    thread.join(1)
+    assert result == [True]
+    assert breaker.state == 'closed'
+
+def test_half_open_probe_reopens(monotonic):
+    breaker = CircuitBreaker(2, 30)
+    open_breaker(breaker)
+    monotonic[0] += 30
+    assert breaker.allow()
+    thread, result = start_waiting(breaker)
+    assert thread.is_alive()
+
+    # the probe fails, so the circuit opens again for another reset time
+    # and the others are turned away
+    breaker.record(False)
+    thread.join(1)
+    assert result == [False]
+    assert breaker.state == 'open'
+    assert breaker.retry_in() == 30
+
+def test_neutral_outcomes(monotonic):
+    # requests that didn't get an answer (a 429 or the deadline) don't
+    # count as failures or successes
+    breaker = CircuitBreaker(2, 30)
+    breaker.record(False)
+    for i in range(5):
+        breaker.record(None)
+    assert breaker.state == 'closed' and breaker.failures == 1
+
+    # a neutral probe lets the next request probe instead, without closing
+    # or opening the circuit
+    breaker = CircuitBreaker(2, 30)
+    open_breaker(breaker)
+    monotonic[0] += 30
+    assert breaker.allow()
+    breaker.record(None)
+    assert breaker.state == 'half_open' and not breaker.probing
+    assert breaker.allow()
+    assert breaker.probing
+
+@pytest.fixture
+def stub(monkeypatch):
+    stub = StubServer().start()
+    monkeypatch.setattr(fullcontact_core, 'API_URL', stub.url)
+    monkeypatch.setattr(fullcontact_core, 'RATE_LIMIT_RETRIES', 1)
+    monkeypatch.setattr(fullcontact_core, 'CIRCUIT_FAILURES', 2)
+    reset_state()
+    yield stub
+    stub.stop()
+    reset_state()
+
+def post(email, ttl=60):
+    data = json.dumps({'email': email})
+    return post_uncached('test ' + email, fullcontact_core.API_URL + '/person.enrich', data, get_headers('test'), ttl)
+
+def test_rate_limited_requests_dont_open(stub):
+    # 429s mean the API is up, so they don't open the circuit
+    stub.set_mix({429: 100})
+    for i in range(3):
+        with pytest.raises(requests.HTTPError):
+            post('user%d@example.com' % i)
+    assert stub.counts[429] >= 3
+    assert fullcontact_core.get_circuit_breaker().state == 'closed'
+
+def test_stale_result_while_open(stub, clock):
+    stub.set_mix({200: 100})
+    status_code, content = post('bilbo@example.com')
+    assert status_code == 200
+
+    # once the result has expired and the circuit is open, the expired
+    # result is returned rather than an error
+    clock.advance(60)
+    stub.set_mix({503: 100})
+    open_breaker(fullcontact_core.get_circuit_breaker())
+    stub.counts = {}
+    assert post('bilbo@example.com') == (200, content)
+    assert stub.counts == {}
+
+    # without an expired result, the open circuit fails right away
+    with pytest.raises(CircuitOpenError):
+        post('frodo@example.com')
+    assert stub.counts == {}
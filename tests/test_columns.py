@@ -0,0 +1,87 @@
+# tests for the columnar output of the bulk runner; the table is written as
+# JSON columns, Parquet and Arrow and read back, with a column that switches
+# from a dictionary to plain values and a column that's added part way
+
+import json
+
+import pytest
+
+import fullcontact_bulk
+from fullcontact_bulk import Table
+
+ROWS = 10
+
+@pytest.fixture
+def records(monkeypatch):
+    # the email column has a distinct value for every row, so it switches
+    # to plain values; the gender column repeats a few values, so it stays
+    # a dictionary; the title column first appears on the fourth row, so
+    # the rows before it are missing a value, as is the last row
+    monkeypatch.setattr(fullcontact_bulk, 'DICTIONARY_MIN_ROWS', 4)
+    records = []
+    for i in range(ROWS):
+        record = {'email': 'user%d@example.com' % i, 'gender': ['Male', 'Female'][i % 2]}
+        if 3 <= i < ROWS - 1:
+            record['title'] = 'Title %d' % (i % 3)
+        records.append(record)
+    return records
+
+def get_table(records):
+    table = Table()
+    for record in records:
+        table.append(record)
+    assert table.columns['email'].values is not None
+    assert table.columns['gender'].values is None
+    assert table.columns['title'].values is None
+    assert table.columns['title'].indexes.tolist()[:3] == [-1, -1, -1]
+    return table
+
+def get_expected(records):
+    names = ['email', 'gender', 'title']
+    return {name: [record.get(name) for record in records] for name in names}
+
+def test_columns(records, tmp_path):
+    path = str(tmp_path / 'output.json')
+    get_table(records).write(path, 'columns')
+    with open(path, encoding='utf-8') as f:
+        output = json.load(f)
+    assert output['rows'] == ROWS
+
+    columns = {}
+    for column in output['columns']:
+        if 'values' in column:
+            columns[column['name']] = column['values']
+        else:
+            columns[column['name']] = [column['dictionary'][index] if index >= 0 else None for index in column['indexes']]
+    assert columns == get_expected(records)
+
+def test_mixed_types():
+    # equal values of different types are kept apart in the dictionary
+    table = Table()
+    for value in [1, True, 1.0, 0, False, 1, True]:
+        table.append({'value': value})
+    column = table.columns['value']
+    assert column.values is None
+    assert [(type(value), value) for value in column.dictionary] == [(int, 1), (bool, True), (float, 1.0), (int, 0), (bool, False)]
+    assert column.indexes.tolist() == [0, 1, 2, 3, 4, 0, 1]
+
+@pytest.mark.parametrize('format', ['parquet', 'arrow'])
+def test_arrow(records, tmp_path, format):
+    pyarrow = pytest.importorskip('pyarrow')
+    path = str(tmp_path / ('output.' + format))
+    get_table(records).write(path, format)
+
+    if format == 'parquet':
+        import pyarrow.parquet
+        table = pyarrow.parquet.read_table(path)
+    else:
+        import pyarrow.ipc
+        with pyarrow.OSFile(path, 'rb') as source:
+            table = pyarrow.ipc.open_file(source).read_all()
+        assert pyarrow.types.is_dictionary(table.schema.field('gender').type)
+        assert pyarrow.types.is_dictionary(table.schema.field('title').type)
+        assert pyarrow.types.is_string(table.schema.field('email').type)
+
+    assert table.num_rows == ROWS
+    assert table.column_names == ['email', 'gender', 'title']
+    assert {name: table.column(name).to_pylist() for name in table.column_names} == get_expected(records)
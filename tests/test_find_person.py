@@ -0,0 +1,24 @@
+# tests for merging the find-person rows that share an identifier into a
+# single lookup
+
+from fullcontact_core import merge_identifiers
+
+def test_merge_identifiers():
+    # rows that share an identifier directly or through another row are
+    # merged into one group, in the order of their first row
+    rows = [
+        (0, ['email:a', 'linkedin:x']),
+        (1, ['email:b']),
+        (2, ['linkedin:x', 'email:c']),
+        (3, ['email:b']),
+        (4, ['email:d', 'linkedin:y']),
+        (5, ['linkedin:y', 'email:a'])
+    ]
+    assert merge_identifiers(rows) == [
+        ([0, 2, 4, 5], ['email:a', 'linkedin:x', 'email:c', 'email:d', 'linkedin:y']),
+        ([1, 3], ['email:b'])
+    ]
+
+def test_merge_identifiers_separate():
+    assert merge_identifiers([(0, ['email:a']), (1, ['email:b'])]) == [([0], ['email:a']), ([1], ['email:b'])]
+    assert merge_identifiers([]) == []
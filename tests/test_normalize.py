@@ -0,0 +1,82 @@
+# tests for the normalization of the input values before they're looked
+# up, and for the deduplication of the lookups
+
+import pytest
+
+from fullcontact_core import normalize_email, normalize_domain, normalize_profile, normalize_values, normalize_rows, dedupe_values, expand_rows
+
+@pytest.mark.parametrize('value, expected', [
+    ('user@example.com', 'user@example.com'),
+    ('  User@Example.COM ', 'user@example.com'),
+    ('mailto:User@Example.com', 'user@example.com'),
+    ('mailto:user@example.com?subject=hello', 'user@example.com'),
+    ('Bilbo Baggins <Bilbo@BagEnd.org>', 'bilbo@bagend.org'),
+    ('user@example.com.', 'user@example.com'),
+    ('user@bücher.de', 'user@bücher.de'),
+    ('', ''),
+    ('   ', ''),
+    ('not-an-email', None),
+    ('user@localhost', None),
+    ('@example.com', None),
+    ('user name@example.com', None)
+])
+def test_normalize_email(value, expected):
+    assert normalize_email(value) == expected
+
+@pytest.mark.parametrize('value, expected', [
+    ('example.com', 'example.com'),
+    ('Example.COM', 'example.com'),
+    ('www.example.com.', 'example.com'),
+    ('https://www.example.com/about?page=1', 'example.com'),
+    ('http://user@example.com:8080/', 'example.com'),
+    ('user@example.com', 'example.com'),
+    ('bücher.de', 'bücher.de'),
+    ('', ''),
+    (' ', ''),
+    ('not a domain', None),
+    ('localhost', None),
+    ('-example.com', None)
+])
+def test_normalize_domain(value, expected):
+    assert normalize_domain(value) == expected
+
+@pytest.mark.parametrize('value, expected', [
+    ('BilboBaggins', 'bilbobaggins'),
+    ('bilbo-baggins', 'bilbo-baggins'),
+    ('https://www.linkedin.com/in/bilbo-baggins/', 'bilbo-baggins'),
+    ('linkedin.com/in/bilbo?trk=profile', 'bilbo'),
+    ('', ''),
+    ('not a profile!', None)
+])
+def test_normalize_profile(value, expected):
+    assert normalize_profile(value) == expected
+
+def test_normalize_values():
+    assert normalize_values(['A@Example.com', 'bad', ''], normalize_email) == ['a@example.com', '', '']
+
+def test_normalize_rows():
+    # a row is kept as long as any of its values is valid
+    rows = [('A@Example.com', 'bad profile!'), ('bad', 'Bilbo'), ('bad', 'bad profile!'), ('', '')]
+    assert normalize_rows(rows, [normalize_email, normalize_profile]) == [
+        ('a@example.com', ''), ('', 'bilbo'), ('', ''), ('', '')
+    ]
+
+def test_dedupe_values():
+    assert dedupe_values(['a', '', 'b', 'a']) == (['a', 'b'], [0, -1, 1, 0])
+    assert dedupe_values([('a', ''), ('', ''), ('a', '')]) == ([('a', '')], [0, -1, 0])
+    assert dedupe_values([]) == ([], [])
+
+def test_expand_rows():
+    assert list(expand_rows([['a'], ['b']], [0, -1, 1, 0])) == [['a'], [''], ['b'], ['a']]
+
+def test_expand_rows_reads_rows_when_needed():
+    # each row is only read when it's first used, so the rows of a chunk
+    # can be written before the next chunk is looked up
+    read = []
+    def rows():
+        for row in (['a'], ['b']):
+            read.append(row)
+            yield row
+    expanded = expand_rows(rows(), [0, 0, 1])
+    assert next(expanded) == ['a'] and read == [['a']]
+    assert list(expanded) == [['a'], ['b']]
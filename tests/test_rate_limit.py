@@ -0,0 +1,21 @@
+# tests for the rate limiter's share of the account's rate limit
+
+from fullcontact_core import RateLimiter
+
+def test_share():
+    limiter = RateLimiter(10, 8, share=0.25)
+    assert limiter.rate == 2.5
+    assert limiter.burst == 2
+    assert limiter.tokens == 2
+
+def test_share_of_header_rate():
+    # the rate from the headers is the whole account's, so each limiter
+    # only takes its share of it
+    limiter = RateLimiter(10, 10, share=0.25)
+    limiter.update(200, {'X-Rate-Limit-Remaining': '60', 'X-Rate-Limit-Reset': '6'})
+    assert limiter.rate == 2.5
+
+def test_no_share():
+    limiter = RateLimiter(10, 10)
+    limiter.update(200, {'X-Rate-Limit-Remaining': '60', 'X-Rate-Limit-Reset': '6'})
+    assert limiter.rate == 10
@@ -0,0 +1,66 @@
+# tests for the incremental refresh mode, against the local stub server;
+# each test counts the requests the stub gets
+
+import time
+
+import pytest
+
+import fullcontact_core
+from harness import Flex, load_function, reset_state
+from stub_server import StubServer
+
+@pytest.fixture
+def stub(monkeypatch):
+    stub = StubServer().start()
+    monkeypatch.setattr(fullcontact_core, 'API_URL', stub.url)
+    monkeypatch.setattr(fullcontact_core, 'PENDING_POLL_DELAY', 0.05)
+    monkeypatch.setattr(fullcontact_core, '_refresh_store', None)
+    reset_state()
+    yield stub
+    stub.stop()
+    reset_state()
+
+def enrich(emails, max_age):
+    module = load_function('fullcontact-enrich-people')
+    flex = Flex([[[email] for email in emails], 'full_name'], {'fullcontact_api_key': 'test', 'fullcontact_time_budget': 0, 'fullcontact_max_age': max_age})
+    module.flexio_handler(flex)
+    return ''.join(flex.output.written)
+
+def wait_for_poller():
+    poller = fullcontact_core._poller
+    for i in range(100):
+        if poller is None or len(poller.pending) == 0:
+            return
+        time.sleep(0.05)
+    raise AssertionError('pending results were never polled')
+
+def test_pending_result_comes_from_cache(stub):
+    # the result of a pending row that the poller has since cached isn't
+    # fetched again on the next refresh
+    emails = ['bilbo@example.com', 'frodo@example.com']
+    stub.set_mix({202: 100})
+    assert enrich(emails, 3600).count('Result Pending...') == 2
+    stub.set_mix({200: 100})
+    wait_for_poller()
+    assert stub.counts == {202: 2, 200: 2}
+    assert enrich(emails, 3600).count('Bilbo Baggins') == 2
+    assert stub.counts == {202: 2, 200: 2}
+
+def test_blank_result_comes_from_cache(stub):
+    # a result that couldn't be found is kept for the negative cache time
+    # rather than looked up again on every refresh
+    stub.set_mix({404: 100})
+    enrich(['nobody@example.com'], 3600)
+    enrich(['nobody@example.com'], 3600)
+    assert stub.counts == {404: 1}
+
+def test_fresh_and_stale_rows(stub):
+    # a row younger than the maximum age is returned as it was stored, and
+    # one that's older is fetched again without the cache
+    stub.set_mix({200: 100})
+    enrich(['bilbo@example.com'], 3600)
+    enrich(['bilbo@example.com'], 3600)
+    assert stub.counts == {200: 1}
+    time.sleep(0.2)
+    assert enrich(['bilbo@example.com'], 0.1).count('Bilbo Baggins') == 1
+    assert stub.counts == {200: 2}
@@ -0,0 +1,69 @@
+# differential check of the precompiled input validator against cerberus,
+# the validator the functions used before, over every combination of a set
+# of input values for the parameters the functions use
+
+import itertools
+from collections import OrderedDict
+
+import pytest
+
+from fullcontact_core import InputValidator, validator_list, to_list, to_range
+
+cerberus = pytest.importorskip('cerberus')
+
+VALUES = [
+    'user@example.com',
+    '',
+    'full_name, title',
+    None,
+    [],
+    ['user@example.com', 'other@example.com'],
+    [['user@example.com'], ['other@example.com']],
+    [['user@example.com'], [None], ['']],
+    [['user@example.com', 'other@example.com']],
+    ['user@example.com', 1],
+    [[1]],
+    1,
+    1.5,
+    True,
+    {'email': 'user@example.com'}
+]
+
+def get_params():
+    params = OrderedDict()
+    params['email'] = {'required': True, 'validator': validator_list, 'coerce': to_range}
+    params['name'] = {'required': False, 'type': 'string'}
+    params['properties'] = {'required': False, 'validator': validator_list, 'coerce': to_list, 'default': '*'}
+    return params
+
+def get_rows():
+    # every combination of values for none of the parameters up to all of
+    # them, and for all of them with an extra value (which is ignored)
+    count = len(get_params())
+    for row in itertools.chain.from_iterable(itertools.product(VALUES, repeat=n) for n in range(count + 1)):
+        yield list(row)
+        if len(row) == count:
+            yield list(row) + ['extra']
+
+def test_validator_matches_cerberus():
+    params = get_params()
+    validator = InputValidator(params)
+    v = cerberus.Validator(params, allow_unknown = True)
+    rows = 0
+    for row in get_rows():
+        expected = v.validated(dict(zip(params.keys(), row)))
+        assert validator.validated(row) == expected, row
+        rows += 1
+    assert rows > 6000
+
+def test_validated_rows_matches_validated():
+    validator = InputValidator(get_params())
+    rows = list(itertools.islice(get_rows(), 500)) + ['user@example.com', None]
+    expected = [validator.validated(row) if isinstance(row, list) else None for row in rows]
+    assert validator.validated_rows(rows) == expected
+
+def test_unsupported_rules():
+    with pytest.raises(ValueError):
+        InputValidator({'email': {'type': 'integer'}})
+    with pytest.raises(ValueError):
+        InputValidator({'email': {'minlength': 1}})